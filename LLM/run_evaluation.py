@@ -38,13 +38,15 @@ def main():
     results = {}
     results["andrewid"] = andrew_id
     
+    print("Retrieving context for all questions...")
+    retrieved = hybrid.search_batch([q["question"] for q in queries], top_k=5, method="rrf")
+    hybrid.close()
+    
     print("\nStarting generation pipeline...")
-    for q in tqdm(queries, desc="Evaluating Queries"):
+    for q, chunks in tqdm(zip(queries, retrieved), total=len(queries), desc="Evaluating Queries"):
         q_id = q["id"]
         q_text = q["question"]
         
-        chunks = hybrid.search(q_text, top_k=5, method="rrf")
-        
         answer = generator.generate(q_text, chunks)
         
         results[q_id] = answer
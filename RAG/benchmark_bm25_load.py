@@ -0,0 +1,61 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from RAG.profiling import rss_mb, private_rss_mb
+
+def measure(mode, index_dir, store_path, queries_path, query_count):
+    """Runs in a fresh interpreter so RSS reflects only this load."""
+    from RAG.sparse_embedder import SparseRetriever
+    with open(queries_path, 'r', encoding='utf-8') as f:
+        queries = [item['question'] for item in json.load(f)][:query_count]
+
+    baseline, private_baseline = rss_mb(), private_rss_mb()
+    retriever = SparseRetriever(index_dir=index_dir, store_path=store_path, mmap=mode == "mmap")
+    start = time.perf_counter()
+    if not retriever.load_index():
+        raise FileNotFoundError(f"No BM25 index at {index_dir}")
+    load_time = time.perf_counter() - start
+    load_rss = rss_mb() - baseline
+
+    # Queries page in the posting lists they touch, which is where mmap pays for its lazy load
+    start = time.perf_counter()
+    retriever.search_batch(queries, top_k=10, n_threads=0)
+    search_time = time.perf_counter() - start
+    print(json.dumps({"load": load_time, "search": search_time, "load_rss": load_rss,
+                      "rss": rss_mb() - baseline, "private": private_rss_mb() - private_baseline}))
+
+def run(index_dir="data/bm25_index", store_path="data/chunk_store.bin", queries_path="leaderboard_queries.json",
+        query_count=100, repeats=3):
+    postings_mb = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(index_dir)
+                      for name in names if name.endswith(".npy")) / 1e6
+    print(f"--- BM25 Load Benchmark: {index_dir} ({postings_mb:.1f} MB of arrays), {query_count} queries after load ---")
+    print(f"{'mode':>6} {'load ms':>9} {'RSS after load MB':>18} {'search ms':>10} {'RSS MB':>8} {'private MB':>11}")
+    for mode in ("ram", "mmap"):
+        runs = []
+        for _ in range(repeats):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), "--measure", mode, index_dir, store_path,
+                                     queries_path, str(query_count)], capture_output=True, text=True, check=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        best = min(runs, key=lambda r: r["load"])
+        print(f"{mode:>6} {best['load'] * 1000:9.1f} {best['load_rss']:18.1f} {best['search'] * 1000:10.1f} "
+              f"{best['rss']:8.1f} {best['private']:11.1f}")
+    print("Private memory is held by each process separately; the rest of an mmap load is shared page cache.")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Cold-start load time and per-process memory of the BM25 index, read into RAM versus memory-mapped.")
+    arg_parser.add_argument("--index-dir", default="data/bm25_index")
+    arg_parser.add_argument("--store", default="data/chunk_store.bin")
+    arg_parser.add_argument("--queries", default="leaderboard_queries.json")
+    arg_parser.add_argument("--query-count", type=int, default=100)
+    arg_parser.add_argument("--measure", nargs=5, metavar=("MODE", "INDEX_DIR", "STORE", "QUERIES", "COUNT"), help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+    if args.measure:
+        measure(*args.measure[:4], int(args.measure[4]))
+    else:
+        run(args.index_dir, args.store, args.queries, args.query_count)
@@ -0,0 +1,70 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from RAG.profiling import rss_mb
+from data_pipeline.chunk_store import ChunkStore, build_chunk_store
+
+def measure(mode, path, lookups):
+    """Runs in a fresh interpreter so RSS reflects only this loader."""
+    baseline = rss_mb()
+    start = time.perf_counter()
+    if mode == "json":
+        with open(path, 'r', encoding='utf-8') as f:
+            id_to_doc = {int(k): v for k, v in json.load(f).items()}
+        load_time = time.perf_counter() - start
+        start = time.perf_counter()
+        records = [id_to_doc[row] for row in lookups]
+    else:
+        store = ChunkStore(path)
+        load_time = time.perf_counter() - start
+        start = time.perf_counter()
+        # Searches arrive with chunk keys, so resolve through the key index as the retrievers do
+        keys = store.all_keys()[lookups]
+        records = [store.record(row) for row in store.rows_for_keys(keys)]
+    lookup_time = time.perf_counter() - start
+    print(json.dumps({"load": load_time, "lookup": lookup_time, "rss": rss_mb() - baseline, "records": len(records)}))
+
+def run(knowledge_base_path="data/knowledge_base.jsonl", lookups=10, repeats=3):
+    with open(knowledge_base_path, 'r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    rows = np.random.default_rng(0).choice(len(records), size=min(lookups, len(records)), replace=False).tolist()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # The mapping exactly as the retrievers used to write it
+        json_path = os.path.join(tmp_dir, "mapping.json")
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({i: record for i, record in enumerate(records)}, f, ensure_ascii=False, indent=2)
+        store_path = os.path.join(tmp_dir, "chunk_store.bin")
+        build_chunk_store(knowledge_base_path, store_path)
+
+        print(f"--- Chunk Store Benchmark: {len(records)} chunks, {len(rows)} records materialized per load ---")
+        for mode, path in (("json", json_path), ("store", store_path)):
+            runs = []
+            for _ in range(repeats):
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), "--measure", mode, path, json.dumps(rows)],
+                                        capture_output=True, text=True, check=True).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+            best = min(runs, key=lambda r: r["load"])
+            label = "JSON mapping (before)" if mode == "json" else "chunk store (after)"
+            print(f"{label:>22}: file {os.path.getsize(path) / 1e6:6.1f} MB  load {best['load'] * 1000:8.2f} ms  "
+                  f"top-k materialization {best['lookup'] * 1000:6.2f} ms  RSS +{best['rss']:6.1f} MB")
+        print("Both retrievers used to hold their own JSON mapping; they now share the chunk store's pages.")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Load time and memory of the JSON id_to_doc mapping versus the chunk store.")
+    arg_parser.add_argument("--knowledge-base", default="data/knowledge_base.jsonl")
+    arg_parser.add_argument("--lookups", type=int, default=10)
+    arg_parser.add_argument("--measure", nargs=3, metavar=("MODE", "PATH", "ROWS"), help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+    if args.measure:
+        measure(args.measure[0], args.measure[1], json.loads(args.measure[2]))
+    else:
+        run(args.knowledge_base, args.lookups)
@@ -0,0 +1,46 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from RAG.document_query_embedder import DenseRetriever
+from RAG.sparse_embedder import SparseRetriever
+from RAG.retriever import HybridRetriever
+
+def run(model_name="BAAI/bge-small-en-v1.5", queries_path="leaderboard_queries.json", limit=100, timeout=None):
+    with open(queries_path, 'r', encoding='utf-8') as f:
+        queries = [item['question'] for item in json.load(f)][:limit]
+
+    # No query caches, so every search pays for a forward pass as a new question would
+    dense = DenseRetriever(model_name=model_name, query_cache_size=0, result_cache_size=0)
+    sparse = SparseRetriever()
+    if not dense.load_index() or not sparse.load_index():
+        raise FileNotFoundError("Build the dense and sparse indexes first (python data_pipeline/run_pipeline.py)")
+    dense.load_model()
+    dense.search(queries[0])
+    sparse.search(queries[0])
+
+    print(f"--- Hybrid Search Latency: {len(queries)} queries, one at a time ---")
+    print(f"{'legs':>11} {'dense p50':>10} {'sparse p50':>11} {'total p50':>10} {'total p99':>10} {'degraded':>9}")
+    for concurrent in (False, True):
+        with HybridRetriever(dense, sparse, concurrent=concurrent, leg_timeout=timeout if concurrent else None) as hybrid:
+            timings = [hybrid.search(query, return_timings=True)[1] for query in queries]
+        dense_ms, sparse_ms, total_ms = (np.array([t[name] for t in timings]) for name in ("dense_ms", "sparse_ms", "total_ms"))
+        degraded = sum(1 for t in timings if t["degraded"])
+        print(f"{'concurrent' if concurrent else 'sequential':>11} {np.percentile(dense_ms, 50):10.2f} "
+              f"{np.percentile(sparse_ms, 50):11.2f} {np.percentile(total_ms, 50):10.2f} {np.percentile(total_ms, 99):10.2f} "
+              f"{degraded:9d}")
+    print(f"Sum of leg p50s vs max: {np.percentile(dense_ms, 50) + np.percentile(sparse_ms, 50):.2f} ms vs "
+          f"{max(np.percentile(dense_ms, 50), np.percentile(sparse_ms, 50)):.2f} ms")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Per-leg and total hybrid search latency, sequential versus concurrent legs.")
+    arg_parser.add_argument("--model", default="BAAI/bge-small-en-v1.5")
+    arg_parser.add_argument("--queries", default="leaderboard_queries.json")
+    arg_parser.add_argument("--limit", type=int, default=100)
+    arg_parser.add_argument("--timeout", type=float, default=None, help="Per-leg timeout in seconds for the concurrent run")
+    args = arg_parser.parse_args()
+    run(args.model, args.queries, args.limit, args.timeout)
@@ -0,0 +1,372 @@
+import os
+import json
+import math
+import shutil
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows: writes go unlocked and leftover segment directories are never swept
+    fcntl = None
+
+# bm25s defaults ("lucene" variant), so scores match the indexes it used to build
+K1 = 1.5
+B = 0.75
+MANIFEST_FILE = "segments.json"
+# Writers hold a shared flock on this file from creating a segment directory until the manifest lists it
+LOCK_FILE = "write.lock"
+# Merge once there are more segments than this, or a segment has this fraction of its documents deleted
+MAX_SEGMENTS = 8
+MAX_DELETED_RATIO = 0.3
+
+def _atomic_save(path, array):
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+@contextmanager
+def _file_lock(path, exclusive=False, blocking=True):
+    """flock on path; yields whether it was acquired (always True when blocking)."""
+    if fcntl is None:
+        yield not exclusive
+        return
+    with open(path, 'a') as f:
+        try:
+            fcntl.flock(f, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def write_segment(path, vocab, terms, docs, tfs, doc_keys, doc_lens):
+    """
+    Writes term-frequency postings to a segment directory and returns it loaded.
+    (terms, docs, tfs) are parallel arrays with at most one entry per term and
+    document; terms index into vocab. Terms without postings are dropped and the
+    postings are stored grouped by term in sorted vocabulary order.
+    """
+    used = np.flatnonzero(np.bincount(terms, minlength=len(vocab)))
+    vocab = [vocab[i] for i in used]
+    order = np.argsort(vocab, kind='stable')
+    vocab = [vocab[i] for i in order]
+    # Old term id -> position in the trimmed, sorted vocabulary
+    remap = np.full(len(used) and used[-1] + 1, -1, dtype='int64')
+    remap[used[order]] = np.arange(len(vocab))
+    terms = remap[terms]
+    postings = np.lexsort((docs, terms))
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(terms, minlength=len(vocab)))]).astype('int64')
+
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    with open(os.path.join(tmp_path, "vocab.json"), 'w', encoding='utf-8') as f:
+        json.dump(vocab, f, ensure_ascii=False)
+    np.save(os.path.join(tmp_path, "indptr.npy"), indptr)
+    np.save(os.path.join(tmp_path, "doc_ids.npy"), docs[postings].astype('int32'))
+    np.save(os.path.join(tmp_path, "tfs.npy"), tfs[postings].astype('float32'))
+    np.save(os.path.join(tmp_path, "doc_keys.npy"), np.asarray(doc_keys, dtype='int64'))
+    np.save(os.path.join(tmp_path, "doc_lens.npy"), np.asarray(doc_lens, dtype='int32'))
+    os.replace(tmp_path, path)
+    return Segment.load(path)
+
+def build_segment(path, doc_keys, corpus_tokens):
+    """Indexes tokenized documents (lists of stemmed terms) as a new segment."""
+    term_ids = {}
+    flat_terms = [term_ids.setdefault(term, len(term_ids)) for tokens in corpus_tokens for term in tokens]
+    doc_lens = np.array([len(tokens) for tokens in corpus_tokens], dtype='int64')
+    flat_docs = np.repeat(np.arange(len(doc_lens)), doc_lens)
+    # One (term, doc) pair per distinct term of each document, with its count as tf
+    pairs, tfs = np.unique(np.array(flat_terms, dtype='int64') * max(len(doc_lens), 1) + flat_docs, return_counts=True)
+    terms, docs = np.divmod(pairs, max(len(doc_lens), 1))
+    return write_segment(path, list(term_ids), terms, docs, tfs, doc_keys, doc_lens)
+
+def merge_segments(path, segments):
+    """Writes the live documents of segments into one new segment, dropping deleted ones."""
+    vocab = sorted(set().union(*(segment.vocab for segment in segments)))
+    term_ids = {term: i for i, term in enumerate(vocab)}
+    terms, docs, tfs, doc_keys, doc_lens = [], [], [], [], []
+    offset = 0
+    for segment in segments:
+        new_doc = np.full(len(segment), -1, dtype='int64')
+        new_doc[segment.live] = offset + np.arange(segment.live_count)
+        segment_terms = np.repeat(np.array([term_ids[term] for term in segment.vocab], dtype='int64'),
+                                  np.diff(segment.indptr))
+        mapped = new_doc[segment.doc_ids]
+        keep = mapped >= 0
+        terms.append(segment_terms[keep])
+        docs.append(mapped[keep])
+        tfs.append(np.asarray(segment.tfs)[keep])
+        doc_keys.append(np.asarray(segment.doc_keys)[segment.live])
+        doc_lens.append(np.asarray(segment.doc_lens)[segment.live])
+        offset += segment.live_count
+    return write_segment(path, vocab, np.concatenate(terms), np.concatenate(docs), np.concatenate(tfs),
+                         np.concatenate(doc_keys), np.concatenate(doc_lens))
+
+class Segment:
+    """
+    An immutable batch of BM25 documents: per-term postings of (document, term
+    frequency), plus each document's chunk key and length. Deletions only
+    rewrite the segment's deleted.npy and return a new Segment sharing the
+    postings, so searches holding the old object are unaffected.
+    """
+    def __init__(self, path, vocab, indptr, doc_ids, tfs, doc_keys, doc_lens, deleted):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.vocab = vocab
+        self.term_cols = {term: i for i, term in enumerate(vocab)}
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_keys = doc_keys
+        self.doc_lens = doc_lens
+        self.deleted = deleted
+        self.live = np.ones(len(doc_keys), dtype=bool)
+        self.live[deleted] = False
+        self.live_count = int(self.live.sum())
+        self.live_length = int(np.asarray(doc_lens)[self.live].sum())
+        # Document frequency of each term among live documents, for the global IDF
+        live_postings = np.concatenate([[0], np.cumsum(self.live[doc_ids])])
+        self.live_df = live_postings[indptr[1:]] - live_postings[indptr[:-1]]
+
+    def __len__(self):
+        return len(self.doc_keys)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        mmap_mode = 'r' if mmap else None
+        with open(os.path.join(path, "vocab.json"), 'r', encoding='utf-8') as f:
+            vocab = json.load(f)
+        arrays = [np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+                  for name in ("indptr", "doc_ids", "tfs", "doc_keys", "doc_lens")]
+        deleted_path = os.path.join(path, "deleted.npy")
+        deleted = np.load(deleted_path) if os.path.exists(deleted_path) else np.zeros(0, dtype='int64')
+        return cls(path, vocab, *arrays, deleted)
+
+    def with_deletions(self, doc_ids):
+        deleted = np.union1d(self.deleted, doc_ids).astype('int64')
+        _atomic_save(os.path.join(self.path, "deleted.npy"), deleted)
+        return Segment(self.path, self.vocab, self.indptr, self.doc_ids, self.tfs, self.doc_keys, self.doc_lens, deleted)
+
+    def live_docs_for_keys(self, keys):
+        return np.flatnonzero(self.live & np.isin(self.doc_keys, keys))
+
+class SegmentedBM25:
+    """
+    A BM25 index stored as a list of segments in index_dir (named in
+    segments.json). Updates add a small segment for new documents and mark
+    removed ones deleted in place, so they cost time proportional to the
+    change. Queries score every segment with document counts, frequencies and
+    average length taken over all live documents, so results equal those of a
+    single index over the same corpus. merge() compacts segments and can run on
+    a background thread while searches and updates continue.
+    """
+    def __init__(self, index_dir, k1=K1, b=B, mmap=False):
+        self.index_dir = index_dir
+        self.k1 = k1
+        self.b = b
+        self.mmap = mmap
+        self.segments = []
+        self.next_id = 0
+        self._lock = threading.RLock()
+        self._view = None
+
+    @staticmethod
+    def exists(index_dir):
+        return os.path.exists(os.path.join(index_dir, MANIFEST_FILE))
+
+    def load(self):
+        with open(os.path.join(self.index_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.k1, self.b = manifest["k1"], manifest["b"]
+        self.next_id = manifest["next_id"]
+        self._set_segments([Segment.load(os.path.join(self.index_dir, name), self.mmap) for name in manifest["segments"]])
+
+    def _writing(self):
+        return _file_lock(os.path.join(self.index_dir, LOCK_FILE))
+
+    def remove_orphans(self):
+        """
+        Deletes segment directories the manifest does not list, left by writes
+        or merges that were interrupted. Only runs when no process is writing a
+        segment; returns how many were removed.
+        """
+        with _file_lock(os.path.join(self.index_dir, LOCK_FILE), exclusive=True, blocking=False) as acquired:
+            if not acquired or not self.exists(self.index_dir):
+                return 0
+            with open(os.path.join(self.index_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+                listed = set(json.load(f)["segments"])
+            orphans = [name for name in os.listdir(self.index_dir) if name.startswith("seg_") and name not in listed]
+            for name in orphans:
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+            return len(orphans)
+
+    def _set_segments(self, segments):
+        # Searches read self.segments and self._view without the lock, so both are replaced, never mutated
+        self.segments = segments
+        self._view = None
+
+    def _write_manifest(self, replaced=()):
+        path = os.path.join(self.index_dir, MANIFEST_FILE)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump({"k1": self.k1, "b": self.b, "next_id": self.next_id,
+                       "segments": [segment.name for segment in self.segments]}, f, indent=2)
+        os.replace(path + ".tmp", path)
+        # Only once the manifest no longer lists them; segments being written concurrently are not listed yet either
+        for segment in replaced:
+            shutil.rmtree(segment.path, ignore_errors=True)
+
+    def _new_segment_path(self):
+        with self._lock:
+            self.next_id += 1
+            return os.path.join(self.index_dir, f"seg_{self.next_id:06d}")
+
+    def __len__(self):
+        return sum(segment.live_count for segment in self.segments)
+
+    def live_keys(self):
+        segments = self.segments
+        return np.concatenate([np.asarray(s.doc_keys)[s.live] for s in segments] + [np.zeros(0, dtype='int64')])
+
+    def rebuild(self, doc_keys, corpus_tokens):
+        """Replaces every segment with one segment holding the given documents."""
+        os.makedirs(self.index_dir, exist_ok=True)
+        if not self.segments and self.exists(self.index_dir):
+            # Picks up the segment numbering and the segments this rebuild replaces
+            self.load()
+        self.remove_orphans()
+        with self._writing():
+            segment = build_segment(self._new_segment_path(), doc_keys, corpus_tokens)
+            with self._lock:
+                replaced = self.segments
+                self._set_segments([segment])
+                self._write_manifest(replaced)
+
+    def add(self, doc_keys, corpus_tokens):
+        if not len(doc_keys):
+            return
+        self.remove_orphans()
+        with self._writing():
+            segment = build_segment(self._new_segment_path(), doc_keys, corpus_tokens)
+            with self._lock:
+                self._set_segments(self.segments + [segment])
+                self._write_manifest()
+
+    def delete(self, keys):
+        """Marks the live documents with the given chunk keys deleted; returns how many were."""
+        keys = np.asarray(list(keys), dtype='int64')
+        deleted = 0
+        with self._lock:
+            segments = []
+            for segment in self.segments:
+                doc_ids = segment.live_docs_for_keys(keys)
+                if len(doc_ids):
+                    segment = segment.with_deletions(doc_ids)
+                    deleted += len(doc_ids)
+                segments.append(segment)
+            if deleted:
+                self._set_segments(segments)
+        return deleted
+
+    def segments_to_merge(self):
+        segments = self.segments
+        if len(segments) > MAX_SEGMENTS:
+            # Fold everything but the largest segment, which keeps merges of small updates cheap
+            largest = max(segments, key=len)
+            return [segment for segment in segments if segment is not largest]
+        return [segment for segment in segments if len(segment) and 1 - segment.live_count / len(segment) > MAX_DELETED_RATIO]
+
+    def merge(self, segments=None):
+        """
+        Merges segments (default: segments_to_merge()) into one. The new segment
+        is written without holding the lock; documents deleted meanwhile are
+        carried over before it replaces its sources.
+        """
+        segments = self.segments_to_merge() if segments is None else segments
+        if not segments or (len(segments) == 1 and segments[0].live_count == len(segments[0])):
+            return False
+        with self._writing():
+            merged = merge_segments(self._new_segment_path(), segments)
+            with self._lock:
+                current = {segment.name: segment for segment in self.segments}
+                if any(segment.name not in current for segment in segments):
+                    # A rebuild or another merge replaced the sources; drop this result
+                    shutil.rmtree(merged.path, ignore_errors=True)
+                    return False
+                newly_deleted = np.concatenate([np.asarray(s.doc_keys)[s.live & ~current[s.name].live] for s in segments])
+                if len(newly_deleted):
+                    merged = merged.with_deletions(merged.live_docs_for_keys(newly_deleted))
+                names = {segment.name for segment in segments}
+                position = min(i for i, segment in enumerate(self.segments) if segment.name in names)
+                remaining = [segment for segment in self.segments if segment.name not in names]
+                self._set_segments(remaining[:position] + [merged] + remaining[position:])
+                self._write_manifest(segments)
+        return True
+
+    def _search_view(self):
+        view = self._view
+        if view is None or view[0] is not self.segments:
+            segments = self.segments
+            offsets = np.cumsum([0] + [len(segment) for segment in segments])
+            doc_count = sum(segment.live_count for segment in segments)
+            avg_len = sum(segment.live_length for segment in segments) / max(doc_count, 1)
+            doc_lens = np.concatenate([np.asarray(s.doc_lens) for s in segments] + [np.zeros(0, dtype='int32')])
+            # The length-normalisation part of the tf denominator, per document across all segments
+            norms = (self.k1 * ((1 - self.b) + self.b * doc_lens / max(avg_len, 1e-9))).astype('float32')
+            keys = np.concatenate([np.asarray(s.doc_keys) for s in segments] + [np.zeros(0, dtype='int64')])
+            live = np.concatenate([s.live for s in segments] + [np.zeros(0, dtype=bool)])
+            view = self._view = (segments, offsets, doc_count, norms, keys, live)
+        return view
+
+    def _score(self, view, query_tokens, top_k):
+        segments, offsets, doc_count, norms, keys, live = view
+        scores = np.zeros(len(keys), dtype='float32')
+        terms, counts = np.unique(query_tokens, return_counts=True) if query_tokens else ([], [])
+        for term, count in zip(terms, counts):
+            cols = [segment.term_cols.get(term) for segment in segments]
+            df = sum(int(segment.live_df[col]) for segment, col in zip(segments, cols) if col is not None)
+            if df == 0:
+                continue
+            # Repeated query terms count once per occurrence, as in bm25s
+            idf = count * math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            for segment, col, offset in zip(segments, cols, offsets):
+                if col is None:
+                    continue
+                start, end = segment.indptr[col], segment.indptr[col + 1]
+                docs = offset + np.asarray(segment.doc_ids[start:end])
+                tfs = np.asarray(segment.tfs[start:end])
+                scores[docs] += idf * tfs / (norms[docs] + tfs)
+        scores[~live] = -np.inf
+
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k] if k else np.zeros(0, dtype='int64')
+        best = best[np.argsort(-scores[best], kind='stable')]
+        result_keys = np.full(top_k, -1, dtype='int64')
+        result_scores = np.zeros(top_k, dtype='float32')
+        found = np.isfinite(scores[best])
+        result_keys[:found.sum()] = keys[best[found]]
+        result_scores[:found.sum()] = scores[best[found]]
+        return result_keys, result_scores
+
+    def search(self, corpus_query_tokens, top_k=10, n_threads=0):
+        """
+        Returns (chunk_keys, scores), both shaped (queries, top_k), for lists of
+        query terms. Missing results (fewer live documents than top_k) have key
+        -1. n_threads > 1 scores queries on a thread pool; -1 uses one per CPU.
+        """
+        view = self._search_view()
+        n_threads = (os.cpu_count() or 1) if n_threads == -1 else n_threads
+        if n_threads > 1 and len(corpus_query_tokens) > 1:
+            with ThreadPoolExecutor(max_workers=n_threads) as executor:
+                results = list(executor.map(lambda tokens: self._score(view, tokens, top_k), corpus_query_tokens))
+        else:
+            results = [self._score(view, tokens, top_k) for tokens in corpus_query_tokens]
+        chunk_keys = np.array([keys for keys, _ in results], dtype='int64').reshape(len(results), top_k)
+        scores = np.array([scores for _, scores in results], dtype='float32').reshape(len(results), top_k)
+        return chunk_keys, scores
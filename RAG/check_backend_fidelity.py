@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from RAG.document_query_embedder import DenseRetriever, QUERY_INSTRUCTION
+from RAG.inference_backends import BACKENDS
+
+def make_tiny_model(path, texts, vocab_size=8000, hidden_size=64, layers=2, seed=0):
+    """
+    Trains a WordPiece tokenizer on texts and saves it next to a randomly
+    initialised BERT encoder, giving a model that can exercise every backend
+    without network access. Its embeddings carry no meaning; only agreement
+    between backends is informative.
+    """
+    import torch
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers, processors, trainers
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    special_tokens = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    tokenizer = Tokenizer(models.WordPiece(unk_token="[UNK]"))
+    tokenizer.normalizer = normalizers.BertNormalizer(lowercase=True)
+    tokenizer.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    tokenizer.train_from_iterator(texts, trainers.WordPieceTrainer(vocab_size=vocab_size, special_tokens=special_tokens))
+    cls_id, sep_id = tokenizer.token_to_id("[CLS]"), tokenizer.token_to_id("[SEP]")
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]", pair="[CLS] $A [SEP] $B:1 [SEP]:1", special_tokens=[("[CLS]", cls_id), ("[SEP]", sep_id)])
+    BertTokenizerFast(tokenizer_object=tokenizer, model_max_length=512, unk_token="[UNK]", sep_token="[SEP]",
+                      pad_token="[PAD]", cls_token="[CLS]", mask_token="[MASK]").save_pretrained(path)
+
+    torch.manual_seed(seed)
+    config = BertConfig(vocab_size=tokenizer.get_vocab_size(), hidden_size=hidden_size, num_hidden_layers=layers,
+                        num_attention_heads=4, intermediate_size=hidden_size * 4)
+    BertModel(config).save_pretrained(path)
+    print(f"Saved a {layers}-layer, {hidden_size}-dim test encoder to {path}")
+
+def top_k_overlap(reference_queries, reference_corpus, queries, corpus, k):
+    reference_top = np.argsort(-(reference_queries @ reference_corpus.T), axis=1)[:, :k]
+    top = np.argsort(-(queries @ corpus.T), axis=1)[:, :k]
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(reference_top, top)]))
+
+def run(model_name, backends, knowledge_base_path="data/knowledge_base.jsonl", queries_path="leaderboard_queries.json",
+        limit=1000, k=10):
+    with open(knowledge_base_path, 'r', encoding='utf-8') as f:
+        texts = [json.loads(line)['text'] for _, line in zip(range(limit), f)]
+    with open(queries_path, 'r', encoding='utf-8') as f:
+        queries = [QUERY_INSTRUCTION + item['question'] for item in json.load(f)]
+
+    embeddings = {}
+    throughput = {}
+    for backend in ["torch"] + [b for b in backends if b != "torch"]:
+        retriever = DenseRetriever(model_name=model_name, cache_dir=None, backend=backend)
+        embeddings[backend] = (retriever.encode(texts), retriever.encode(queries))
+        # Corpus encode dominates, so its stats stand for the backend
+        retriever.encode(texts)
+        stats = retriever.last_encode_stats
+        throughput[backend] = stats["tokens"] / stats["seconds"]
+
+    reference_corpus, reference_queries = embeddings["torch"]
+    print(f"\n--- Backend Fidelity vs fp32 torch: {len(texts)} chunks, {len(queries)} queries, top-{k} ---")
+    print(f"{'backend':>10} {'cos mean':>9} {'cos min':>8} {'top-k overlap':>14} {'tokens/sec':>11} {'speedup':>8}")
+    for backend, (corpus, query_vectors) in embeddings.items():
+        # Rows are L2-normalised, so the row-wise dot product is the cosine similarity
+        cosines = np.concatenate([np.sum(corpus * reference_corpus, axis=1), np.sum(query_vectors * reference_queries, axis=1)])
+        overlap = top_k_overlap(reference_queries, reference_corpus, query_vectors, corpus, k)
+        print(f"{backend:>10} {cosines.mean():9.5f} {cosines.min():8.5f} {overlap:14.3f} {throughput[backend]:11.0f} "
+              f"{throughput[backend] / throughput['torch']:7.2f}x")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Compare optimized inference backends against the fp32 PyTorch encoder.")
+    arg_parser.add_argument("--model", default="BAAI/bge-small-en-v1.5")
+    arg_parser.add_argument("--backends", nargs="+", default=["int8"], choices=BACKENDS)
+    arg_parser.add_argument("--knowledge-base", default="data/knowledge_base.jsonl")
+    arg_parser.add_argument("--queries", default="leaderboard_queries.json")
+    arg_parser.add_argument("--limit", type=int, default=1000)
+    arg_parser.add_argument("--create-tiny-model", metavar="DIR",
+                            help="Build a small random encoder from the knowledge base in DIR and test against it (offline)")
+    args = arg_parser.parse_args()
+
+    model_name = args.model
+    if args.create_tiny_model:
+        with open(args.knowledge_base, 'r', encoding='utf-8') as f:
+            make_tiny_model(args.create_tiny_model, [json.loads(line)['text'] for line in f])
+        model_name = args.create_tiny_model
+    run(model_name, args.backends, args.knowledge_base, args.queries, args.limit)
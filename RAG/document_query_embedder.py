@@ -2,43 +2,189 @@ import os
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 import json
+import time
+import threading
+import unicodedata
 import numpy as np
-import torch
 import faiss
-from transformers import AutoTokenizer, AutoModel
+from RAG.embedding_cache import EmbeddingCache
+from RAG.inference_backends import BACKENDS, load_encoder
+from RAG.lru_cache import LRUCache, results_nbytes
+from data_pipeline.chunk_store import chunk_key, open_chunk_store, update_chunk_store
+from RAG.index_factory import create_index, index_type_of, set_search_params, supports_remove, DEFAULT_NPROBE, DEFAULT_EF_SEARCH, COMPRESSED_TYPES
+from RAG.rescoring import FullPrecisionVectors, write_full_vectors, rescore
+
+# BGE models require an explicit instruction prefix for query embeddings
+QUERY_INSTRUCTION = "Represent this sentence for searching relevant passages: "
+
+KNOWLEDGE_BASE = "data/knowledge_base.jsonl"
 
 class DenseRetriever:
-    def __init__(self, model_name="BAAI/bge-small-en-v1.5", index_path="data/faiss_index.bin", map_path="data/faiss_mapping.json"):
-        print(f"Loading HuggingFace model: {model_name}...")
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModel.from_pretrained(model_name)
-        
-        if torch.cuda.is_available():
-            self.device = torch.device("cuda")
-        else:
-            self.device = torch.device("cpu")
-        
-        self.model.to(self.device)
-        print(f"Model loaded to {self.device}")
+    def __init__(self, model_name="BAAI/bge-small-en-v1.5", index_path="data/faiss_index.bin", map_path="data/faiss_mapping.json",
+                 store_path="data/chunk_store.bin", knowledge_base_path=KNOWLEDGE_BASE,
+                 cache_dir="data/embedding_cache", cache_dtype="float32", max_batch_tokens=8192,
+                 index_type="flat", index_params=None, nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH,
+                 backend="torch", query_cache_size=1024, result_cache_size=1024, cache_max_bytes=64 * 2**20,
+                 vectors_path="data/faiss_vectors.npy", rescore_factor=4):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend '{backend}', expected one of {', '.join(BACKENDS)}")
+        # The tokenizer and model load on first use, so processes that only open the index start fast.
+        # See RAG/inference_backends.py for the backends: "torch", "int8", "onnx" or "onnx-int8"
+        self.model_name = model_name
+        self.backend = backend
+        self._tokenizer = None
+        self._model = None
+        self._device = None
+        # Searches on several threads (e.g. a hybrid leg that timed out while loading, then the next
+        # search's leg) must not load the model twice; reentrant because load_model loads the tokenizer
+        self._load_lock = threading.RLock()
         
         self.index_path = index_path
+        # map_path is only read to upgrade indexes built before the chunk store existed
         self.map_path = map_path
+        self.store_path = store_path
+        # The chunk store is rebuilt from this file whenever it is missing or older
+        self.knowledge_base_path = knowledge_base_path
         
         self.index = None
-        self.id_to_doc = {} 
+        self.store = None
+        
+        # See RAG/index_factory.py; index_params go to create_index, nprobe/ef_search apply at query time
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        # Compressed index types fetch rescore_factor * top_k candidates and re-rank them
+        # exactly against float32 vectors memory-mapped from vectors_path
+        self.vectors_path = vectors_path
+        self.rescore_factor = rescore_factor
+        self.full_vectors = None
+        
+        # Chunk embeddings persist across builds; pass cache_dir=None to always run the model.
+        # Opened on first use, since loading reads every key and query-only processes never need it
+        self.cache_dir = cache_dir
+        self.cache_dtype = cache_dtype
+        self._embedding_cache = None
+        # Padded-token budget per forward pass; None falls back to fixed batches of batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.last_encode_stats = None
+        
+        # LRU caches for repeated queries; a size of 0 disables either one
+        self.query_cache = LRUCache(query_cache_size, cache_max_bytes, nbytes=lambda v: v.nbytes) if query_cache_size else None
+        self.result_cache = LRUCache(result_cache_size, cache_max_bytes, nbytes=results_nbytes) if result_cache_size else None
+        self.index_version = 0
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            with self._load_lock:
+                if self._tokenizer is None:
+                    from transformers import AutoTokenizer
+                    self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        return self._tokenizer
+
+    @property
+    def embedding_cache(self):
+        if self._embedding_cache is None and self.cache_dir:
+            with self._load_lock:
+                if self._embedding_cache is None:
+                    self._embedding_cache = EmbeddingCache(self.cache_dir, self.model_name, dtype=self.cache_dtype,
+                                                           backend=self.backend)
+        return self._embedding_cache
+
+    @property
+    def model(self):
+        if self._model is None:
+            self.load_model()
+        return self._model
+
+    @property
+    def device(self):
+        if self._device is None:
+            self.load_model()
+        return self._device
+
+    def load_model(self):
+        """Loads the tokenizer and encoder now instead of on the first encode."""
+        if self._model is not None:
+            return
+        with self._load_lock:
+            if self._model is not None:
+                return
+            print(f"Loading HuggingFace model: {self.model_name}...")
+            start = time.perf_counter()
+            model, device = load_encoder(self.model_name, self.tokenizer, self.backend)
+            # _device first: other threads only skip the lock once _model is set
+            self._device = device
+            self._model = model
+            print(f"Model loaded to {self._device} ({self.backend} backend) in {time.perf_counter() - start:.1f}s")
 
     def mean_pooling(self, model_output, attention_mask):
+        import torch
         token_embeddings = model_output[0] 
         input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
         return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(input_mask_expanded.sum(1), min=1e-9)
 
-    def encode(self, texts, batch_size=32):
-        all_embeddings = []
+    def encode(self, texts, batch_size=32, use_cache=True):
+        """
+        Embeds texts, answering from the embedding cache where possible so only
+        texts the model has not seen before are run through it.
+        """
+        if not use_cache or not texts or self.embedding_cache is None:
+            return self._embed(texts, batch_size)
         
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i:i + batch_size]
-            
-            encoded_input = self.tokenizer(batch_texts, padding=True, truncation=True, return_tensors='pt', max_length=512)
+        cache = self.embedding_cache
+        keys = cache.keys(texts)
+        rows = cache.lookup(keys)
+        missing = {}
+        for i, key in enumerate(keys):
+            if rows[i] < 0:
+                missing.setdefault(key, i)
+        print(f"Embedding cache: {len(texts) - int((rows < 0).sum())}/{len(texts)} hits, embedding {len(missing)} texts")
+        if missing:
+            cache.add(list(missing), self._embed([texts[i] for i in missing.values()], batch_size))
+            rows = cache.lookup(keys)
+        return cache.get(rows)
+
+    def _batches(self, lengths, batch_size):
+        """
+        Index batches for the model. With max_batch_tokens set, texts are sorted
+        longest-first and each batch grows until its padded size (rows x longest
+        member) would exceed the budget, so short texts are not padded to the
+        length of an unrelated long one. Otherwise fixed batches in input order.
+        """
+        if not self.max_batch_tokens:
+            return [list(range(i, min(i + batch_size, len(lengths)))) for i in range(0, len(lengths), batch_size)]
+        
+        batches = []
+        batch = []
+        batch_width = 0
+        for i in sorted(range(len(lengths)), key=lambda i: -lengths[i]):
+            # Sorted descending, so the first member sets the padded width of the batch
+            width = batch_width or lengths[i]
+            if batch and (len(batch) + 1) * width > self.max_batch_tokens:
+                batches.append(batch)
+                batch, width = [], lengths[i]
+            batch.append(i)
+            batch_width = width
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _embed(self, texts, batch_size=32):
+        import torch
+        if len(texts) == 0:
+            return np.zeros((0, self.model.config.hidden_size), dtype='float32')
+        start = time.perf_counter()
+        # Tokenized once up front; batches are padded from these ids rather than re-tokenized
+        features = self.tokenizer(list(texts), truncation=True, max_length=512)
+        lengths = [len(ids) for ids in features['input_ids']]
+        embeddings = np.empty((len(texts), self.model.config.hidden_size), dtype='float32')
+        padded_tokens = 0
+        
+        for batch in self._batches(lengths, batch_size):
+            encoded_input = self.tokenizer.pad({k: [v[i] for i in batch] for k, v in features.items()}, return_tensors='pt')
+            padded_tokens += encoded_input['input_ids'].numel()
             encoded_input = {k: v.to(self.device) for k, v in encoded_input.items()}
             
             with torch.no_grad():
@@ -48,20 +194,20 @@ class DenseRetriever:
             
             sentence_embeddings = torch.nn.functional.normalize(sentence_embeddings, p=2, dim=1)
             
-            all_embeddings.extend(sentence_embeddings.cpu().numpy())
+            embeddings[batch] = sentence_embeddings.cpu().numpy()
             
-        return np.array(all_embeddings).astype('float32')
+        elapsed = time.perf_counter() - start
+        self.last_encode_stats = {"texts": len(texts), "tokens": sum(lengths), "padded_tokens": padded_tokens, "seconds": elapsed}
+        if len(texts) > 1:
+            print(f"Encoded {len(texts)} texts: {sum(lengths)} tokens ({padded_tokens} with padding) in {elapsed:.1f}s, "
+                  f"{sum(lengths) / max(elapsed, 1e-9):.0f} tokens/sec")
+        return embeddings
 
-    def build_index(self, knowledge_base_path="data/knowledge_base.jsonl"):
+    def build_index(self, knowledge_base_path=None):
         print("Reading knowledge base...")
-        texts = []
-        doc_ids = []
-        
-        with open(knowledge_base_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                record = json.loads(line)
-                texts.append(record['text'])
-                doc_ids.append(record)
+        self.store = open_chunk_store(self.store_path, knowledge_base_path or self.knowledge_base_path,
+                                      rebuild=knowledge_base_path is not None)
+        texts = [self.store.text(row) for row in range(len(self.store))]
                 
         print(f"Generating embeddings for {len(texts)} chunks (this might take a few minutes)...")
         embeddings = self.encode(texts)
@@ -69,49 +215,246 @@ class DenseRetriever:
         dimension = embeddings.shape[1]
         print(f"Building FAISS index (Dimension: {dimension})...")
         
-        self.index = faiss.IndexFlatIP(dimension) 
-        self.index.add(embeddings)
-        
-        for i, record in enumerate(doc_ids):
-            self.id_to_doc[i] = record
+        # Vectors are keyed by a hash of the chunk id rather than by position, so
+        # chunks can later be added and removed without re-embedding the rest
+        self.index = self._new_index(embeddings)
+        self.index.add_with_ids(embeddings, self.store.all_keys())
+        self._write_full_vectors(self.store.all_keys(), embeddings)
+        self._index_changed()
             
         self.save_index()
+        self._evict_unreferenced()
         print("FAISS Index successfully built and saved!")
 
+    def _index_keys(self):
+        return faiss.vector_to_array(self.index.id_map)
+
+    def _apply_changes(self, added_keys, added_texts, removed_keys):
+        indexed = set(self._index_keys().tolist())
+        removed_keys = [key for key in removed_keys if key in indexed]
+        if removed_keys:
+            if supports_remove(self.index):
+                self.index.remove_ids(np.array(removed_keys, dtype='int64'))
+            else:
+                # HNSW graphs cannot drop nodes, so the index is rebuilt from the remaining chunks
+                self.compact(keep_keys=indexed - set(removed_keys))
+        
+        added = [(key, text) for key, text in zip(added_keys, added_texts) if key not in indexed]
+        embeddings = np.zeros((0, self.index.d), dtype='float32')
+        if added:
+            print(f"Generating embeddings for {len(added)} new chunks...")
+            embeddings = self.encode([text for _, text in added])
+            self.index.add_with_ids(embeddings, np.array([key for key, _ in added], dtype='int64'))
+                
+        if added or removed_keys:
+            if self.full_vectors is not None:
+                self.full_vectors = self.full_vectors.updated([key for key, _ in added], embeddings, removed_keys)
+            self._index_changed()
+        print(f"FAISS index updated: +{len(added)} / -{len(removed_keys)} vectors ({self.index.ntotal} total)")
+        return len(added), len(removed_keys)
+
+    def update_index(self, added_records=(), removed_chunk_ids=()):
+        """
+        Embeds and adds only added_records and drops the vectors of
+        removed_chunk_ids; every other vector is left untouched.
+        """
+        added_records = list(added_records)
+        removed_keys = [chunk_key(chunk_id) for chunk_id in removed_chunk_ids]
+        # Results are resolved through the chunk store, so it has to hold the new records too
+        self.store = update_chunk_store(self.store_path, added_records, removed_keys)
+        changes = self._apply_changes([chunk_key(record['id']) for record in added_records],
+                                      [record['text'] for record in added_records], removed_keys)
+        self.save_index()
+        self._evict_unreferenced()
+        return changes
+
+    def update_from_knowledge_base(self, knowledge_base_path=None):
+        """Brings a loaded index in line with the knowledge base, embedding only new chunks."""
+        self.store = open_chunk_store(self.store_path, knowledge_base_path or self.knowledge_base_path,
+                                      rebuild=knowledge_base_path is not None)
+        self._index_changed()
+        current = self.store.all_keys()
+        indexed = self._index_keys()
+        removed = np.setdiff1d(indexed, current)
+        added_rows = np.flatnonzero(~np.isin(current, indexed))
+        
+        self._apply_changes(current[added_rows].tolist(), [self.store.text(row) for row in added_rows], removed.tolist())
+        self.check_consistency()
+        self.save_index()
+        self._evict_unreferenced()
+
+    def _texts_for_keys(self, keys):
+        rows = self.store.rows_for_keys(keys)
+        return [self.store.text(row) for row in rows if row >= 0]
+
+    def _evict_unreferenced(self):
+        # Only chunks still in the index are worth keeping embeddings for
+        if self.embedding_cache is not None:
+            removed = self.embedding_cache.evict(self.embedding_cache.keys(self._texts_for_keys(self._index_keys())))
+            if removed:
+                print(f"Embedding cache: evicted {removed} unreferenced entries")
+
+    def _write_full_vectors(self, keys, vectors):
+        if self.index_type in COMPRESSED_TYPES:
+            self.full_vectors = write_full_vectors(self.vectors_path, keys, vectors)
+
+    def _new_index(self, vectors):
+        index = create_index(self.index_type, vectors, **self.index_params)
+        set_search_params(index, nprobe=self.nprobe, ef_search=self.ef_search)
+        return index
+
+    def compact(self, keep_keys=None):
+        """
+        Rebuilds (and for IVF types retrains) the index from its chunks in the
+        chunk store, dropping any slack left by removals as well as vectors whose
+        chunk is gone. Vectors come from the embedding cache, so the model only
+        runs for chunks missing from it.
+        """
+        keys = self._index_keys() if keep_keys is None else np.array(sorted(keep_keys), dtype='int64')
+        rows = self.store.rows_for_keys(keys)
+        keys = keys[rows >= 0]
+        vectors = self.encode([self.store.text(row) for row in rows[rows >= 0]])
+        self.index = self._new_index(vectors)
+        self.index.add_with_ids(vectors, keys)
+        self._write_full_vectors(keys, vectors)
+        self._index_changed()
+        print(f"FAISS index compacted to {self.index.ntotal} vectors")
+
+    def check_consistency(self):
+        """Returns a list of mismatches between the FAISS ids and the chunk store (empty when consistent)."""
+        problems = []
+        index_keys = self._index_keys()
+        unique_keys = np.unique(index_keys)
+        if len(unique_keys) != len(index_keys):
+            problems.append(f"{len(index_keys) - len(unique_keys)} duplicate ids in the FAISS index")
+        store_keys = self.store.all_keys()
+        missing_docs = np.setdiff1d(unique_keys, store_keys)
+        if len(missing_docs):
+            problems.append(f"{len(missing_docs)} FAISS ids have no chunk in the store")
+        missing_vectors = np.setdiff1d(store_keys, unique_keys)
+        if len(missing_vectors):
+            problems.append(f"{len(missing_vectors)} stored chunks have no vector")
+        if self.full_vectors is not None:
+            missing_full = int((self.full_vectors.rows_for_keys(unique_keys) < 0).sum())
+            if missing_full:
+                problems.append(f"{missing_full} FAISS ids have no full-precision vector for re-scoring")
+        for problem in problems:
+            print(f"FAISS consistency check: {problem}")
+        return problems
+
     def save_index(self):
         os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
         faiss.write_index(self.index, self.index_path)
-        with open(self.map_path, 'w', encoding='utf-8') as f:
-            json.dump(self.id_to_doc, f, ensure_ascii=False, indent=2)
+        # Chunk records now live in the shared chunk store; a leftover JSON mapping would only go stale
+        if self.map_path and os.path.exists(self.map_path):
+            os.remove(self.map_path)
 
     def load_index(self):
-        if os.path.exists(self.index_path) and os.path.exists(self.map_path):
-            self.index = faiss.read_index(self.index_path)
-            with open(self.map_path, 'r', encoding='utf-8') as f:
-                raw_mapping = json.load(f)
-                self.id_to_doc = {int(k): v for k, v in raw_mapping.items()}
-            return True
-        return False
+        if not os.path.exists(self.index_path):
+            return False
+        if not os.path.exists(self.store_path) and not os.path.exists(self.knowledge_base_path):
+            return False
+        self.index = faiss.read_index(self.index_path)
+        self.store = open_chunk_store(self.store_path, self.knowledge_base_path)
+        if not isinstance(self.index, faiss.IndexIDMap2):
+            if not (self.map_path and os.path.exists(self.map_path)):
+                return False
+            self._upgrade_positional_index()
+        # Compaction rebuilds whatever type is on disk, not the constructor default
+        self.index_type = index_type_of(self.index)
+        set_search_params(self.index, nprobe=self.nprobe, ef_search=self.ef_search)
+        self.full_vectors = None
+        if self.index_type in COMPRESSED_TYPES:
+            if os.path.exists(self.vectors_path):
+                self.full_vectors = FullPrecisionVectors(self.vectors_path)
+            else:
+                print(f"No full-precision vectors at {self.vectors_path}; {self.index_type} results will not be re-scored")
+        self._index_changed()
+        return True
+
+    def _upgrade_positional_index(self):
+        # Indexes built before chunk-id keys address vectors by line number, resolved through the old JSON mapping
+        with open(self.map_path, 'r', encoding='utf-8') as f:
+            id_to_doc = {int(k): v for k, v in json.load(f).items()}
+        positions = sorted(id_to_doc)
+        vectors = self.index.reconstruct_n(0, self.index.ntotal)[positions]
+        keys = np.array([chunk_key(id_to_doc[p]['id']) for p in positions], dtype='int64')
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.index.d))
+        index.add_with_ids(vectors, keys)
+        self.index = index
 
     def search(self, query: str, top_k: int = 5):
-        # BGE models require an explicit instruction prefix for query embeddings
-        instruction = "Represent this sentence for searching relevant passages: "
-        query_embedding = self.encode([instruction + query])
-        
-        distances, indices = self.index.search(query_embedding, top_k)
+        return self.search_batch([query], top_k=top_k)[0]
+
+    def normalize_query(self, query: str) -> str:
+        # Whitespace and Unicode variants embed identically; case only folds when the tokenizer lowercases anyway
+        query = " ".join(unicodedata.normalize("NFKC", query).split())
+        return query.lower() if getattr(self.tokenizer, "do_lower_case", False) else query
+
+    def _index_changed(self):
+        # Cached results are only valid for the index and chunk store they were computed on
+        self.index_version += 1
+        if self.result_cache is not None:
+            self.result_cache.clear()
+
+    def cache_stats(self):
+        return {"query_embeddings": self.query_cache.stats() if self.query_cache is not None else None,
+                "results": self.result_cache.stats() if self.result_cache is not None else None,
+                "index_version": self.index_version}
+
+    def _embed_queries(self, normalized_queries, batch_size):
+        """Query embeddings, running the model only for queries not in the LRU cache."""
+        vectors = [self.query_cache.get(query) if self.query_cache is not None else None for query in normalized_queries]
+        missing = list(dict.fromkeys(q for q, v in zip(normalized_queries, vectors) if v is None))
+        if missing:
+            embedded = dict(zip(missing, self.encode([QUERY_INSTRUCTION + q for q in missing], batch_size=batch_size, use_cache=False)))
+            if self.query_cache is not None:
+                for query, vector in embedded.items():
+                    self.query_cache.put(query, vector)
+            vectors = [embedded[q] if v is None else v for q, v in zip(normalized_queries, vectors)]
+        return np.vstack(vectors)
+
+    def search_batch(self, queries, top_k: int = 5, batch_size: int = 32):
+        """
+        Encodes all queries together and runs one FAISS search over the query
+        matrix. Returns one result list per query, in input order. Repeated
+        queries are answered from the result cache, or at least skip the model
+        through the query-embedding cache.
+        """
+        if not queries:
+            return []
+        normalized = [self.normalize_query(query) for query in queries]
+        batch_results = [self.result_cache.get((query, top_k)) if self.result_cache is not None else None for query in normalized]
+        pending = [i for i, results in enumerate(batch_results) if results is None]
         
-        results = []
-        for dist, idx in zip(distances[0], indices[0]):
-            if idx != -1:
-                doc = self.id_to_doc.get(idx, {})
-                results.append({
-                    "score": float(dist),
-                    "chunk_id": doc.get('id'),
-                    "source": doc.get('source'),
-                    "text": doc.get('text')
-                })
+        if pending:
+            query_embeddings = self._embed_queries([normalized[i] for i in pending], batch_size)
+            if self.full_vectors is not None:
+                # Candidates come from the compact codes; their final order from exact inner products
+                _, candidates = self.index.search(query_embeddings, top_k * self.rescore_factor)
+                distances, indices = rescore(query_embeddings, candidates, self.full_vectors, top_k)
+            else:
+                distances, indices = self.index.search(query_embeddings, top_k)
+            # Only the top-k rows are decoded from the chunk store
+            rows = self.store.rows_for_keys(indices.ravel()).reshape(indices.shape)
+            
+            for i, query_distances, query_indices, query_rows in zip(pending, distances, indices, rows):
+                results = []
+                for dist, idx, row in zip(query_distances, query_indices, query_rows):
+                    if idx != -1 and row >= 0:
+                        doc = self.store.record(row)
+                        results.append({
+                            "score": float(dist),
+                            "chunk_id": doc.get('id'),
+                            "source": doc.get('source'),
+                            "text": doc.get('text')
+                        })
+                batch_results[i] = results
+                if self.result_cache is not None:
+                    self.result_cache.put((normalized[i], top_k), results)
                 
-        return results
+        # Callers annotate result dicts in place (e.g. fusion scores), so cached lists are never handed out
+        return [[dict(result) for result in results] for results in batch_results]
 
 if __name__ == "__main__":
     embedder = DenseRetriever()
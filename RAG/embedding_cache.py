@@ -0,0 +1,132 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+KEY_BYTES = 16
+
+def embedding_key(model_name: str, text: str, backend: str = "torch") -> bytes:
+    return hashlib.blake2b(f"{model_name}\0{backend}\0{text}".encode('utf-8'), digest_size=KEY_BYTES).digest()
+
+class EmbeddingCache:
+    """
+    On-disk store of embeddings keyed by a hash of (model name, backend, text).
+
+    Quantized backends produce slightly different vectors, so each model and
+    backend pair gets its own directory holding three files: `keys.bin` (16-byte
+    digests in row order), `vectors.bin` (raw float32 or float16 rows, read
+    through a memory map) and `meta.json`. New rows are appended; `evict`
+    rewrites the files keeping only the keys still referenced.
+    """
+    def __init__(self, cache_dir, model_name, dtype="float32", backend="torch"):
+        self.model_name = model_name
+        self.backend = backend
+        self.dir = os.path.join(cache_dir, model_name.strip("/").replace("/", "__"), backend)
+        self.keys_path = os.path.join(self.dir, "keys.bin")
+        self.vectors_path = os.path.join(self.dir, "vectors.bin")
+        self.meta_path = os.path.join(self.dir, "meta.json")
+        self.dtype = np.dtype(dtype)
+        self.dim = None
+        self.count = 0
+        self.rows = {}
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            # Rows written before the first meta.json (an interrupted run) cannot be trusted
+            self._clear_files()
+            return
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if np.dtype(meta["dtype"]) != self.dtype:
+            print(f"Embedding cache at {self.dir} stores {meta['dtype']}, not {self.dtype}; starting a new one")
+            # add() appends, so the old rows have to go or they would be read back as the new dtype
+            self._clear_files()
+            return
+        self.dim = meta["dim"]
+        row_bytes = self.dim * self.dtype.itemsize
+        # Rows appended after the last meta write (an interrupted run) are dropped
+        self.count = min(meta["count"],
+                         os.path.getsize(self.keys_path) // KEY_BYTES,
+                         os.path.getsize(self.vectors_path) // row_bytes)
+        for path, size in ((self.keys_path, self.count * KEY_BYTES), (self.vectors_path, self.count * row_bytes)):
+            if os.path.getsize(path) != size:
+                os.truncate(path, size)
+
+        with open(self.keys_path, 'rb') as f:
+            keys = f.read()
+        self.rows = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(self.count)}
+
+    def _clear_files(self):
+        for path in (self.meta_path, self.keys_path, self.vectors_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _write_meta(self):
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"model_name": self.model_name, "backend": self.backend, "dim": self.dim, "dtype": self.dtype.name,
+                       "count": self.count}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def _memmap(self):
+        if self._vectors is None or len(self._vectors) != self.count:
+            self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode='r', shape=(self.count, self.dim))
+        return self._vectors
+
+    def keys(self, texts):
+        return [embedding_key(self.model_name, text, self.backend) for text in texts]
+
+    def lookup(self, keys):
+        """Row number per key, or -1 for keys that are not cached."""
+        rows = np.array([self.rows.get(key, -1) for key in keys], dtype='int64')
+        found = int((rows >= 0).sum())
+        self.hits += found
+        self.misses += len(rows) - found
+        return rows
+
+    def get(self, rows):
+        return np.asarray(self._memmap()[rows], dtype='float32')
+
+    def add(self, keys, vectors):
+        new = {}
+        for key, vector in zip(keys, vectors):
+            if key not in self.rows and key not in new:
+                new[key] = vector
+        if not new:
+            return
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        os.makedirs(self.dir, exist_ok=True)
+        with open(self.keys_path, 'ab') as f:
+            f.write(b"".join(new))
+        with open(self.vectors_path, 'ab') as f:
+            f.write(np.asarray(list(new.values()), dtype=self.dtype).tobytes())
+        for key in new:
+            self.rows[key] = self.count
+            self.count += 1
+        self._write_meta()
+
+    def evict(self, keep_keys):
+        """Drops every entry whose key is not in keep_keys. Returns the number removed."""
+        keep_rows = sorted({self.rows[key] for key in keep_keys if key in self.rows})
+        removed = self.count - len(keep_rows)
+        if removed == 0:
+            return 0
+
+        vectors = np.array(self._memmap()[keep_rows]) if keep_rows else np.zeros((0, self.dim), dtype=self.dtype)
+        keys_by_row = {row: key for key, row in self.rows.items()}
+        kept_keys = [keys_by_row[row] for row in keep_rows]
+        self._vectors = None
+        for path, data in ((self.keys_path, b"".join(kept_keys)), (self.vectors_path, vectors.tobytes())):
+            with open(path + ".tmp", 'wb') as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+
+        self.rows = {key: i for i, key in enumerate(kept_keys)}
+        self.count = len(kept_keys)
+        self._write_meta()
+        return removed
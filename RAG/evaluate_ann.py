@@ -0,0 +1,102 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from RAG.document_query_embedder import DenseRetriever, QUERY_INSTRUCTION
+from RAG.index_factory import INDEX_TYPES, COMPRESSED_TYPES, create_index, set_search_params, index_memory_bytes
+from RAG.rescoring import write_full_vectors, rescore
+
+# Query-time settings swept per index type; flat has none
+SEARCH_SWEEPS = {
+    "flat": [{}],
+    "hnsw": [{"ef_search": ef} for ef in (16, 32, 64, 128, 256)],
+    "ivf_flat": [{"nprobe": nprobe} for nprobe in (1, 4, 16, 64)],
+    "ivf_pq": [{"nprobe": nprobe} for nprobe in (1, 4, 16, 64)],
+    "sq8": [{}],
+    "fp16": [{}],
+    "pca": [{}],
+}
+
+def load_texts(knowledge_base_path, limit):
+    texts = []
+    with open(knowledge_base_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            texts.append(json.loads(line)['text'])
+            if limit and len(texts) >= limit:
+                break
+    return texts
+
+def load_queries(queries_path):
+    with open(queries_path, 'r', encoding='utf-8') as f:
+        return [QUERY_INSTRUCTION + item['question'] for item in json.load(f)]
+
+def time_queries(index, queries, k, full_vectors=None, rescore_factor=4):
+    # One query per call, as the retriever issues them
+    latencies = []
+    results = np.empty((len(queries), k), dtype='int64')
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        if full_vectors is None:
+            _, ids = index.search(queries[i:i + 1], k)
+        else:
+            _, candidates = index.search(queries[i:i + 1], k * rescore_factor)
+            _, ids = rescore(queries[i:i + 1], candidates, full_vectors, k)
+        latencies.append(time.perf_counter() - start)
+        results[i] = ids[0]
+    return results, np.array(latencies) * 1000
+
+def recall_at_k(results, exact):
+    return float(np.mean([len(set(r) & set(e)) / len(e) for r, e in zip(results, exact)]))
+
+def run(knowledge_base_path="data/knowledge_base.jsonl", queries_path="leaderboard_queries.json",
+        model_name="BAAI/bge-small-en-v1.5", index_types=INDEX_TYPES, k=10, limit=None, rescore_factor=4):
+    retriever = DenseRetriever(model_name=model_name)
+    vectors = retriever.encode(load_texts(knowledge_base_path, limit))
+    queries = retriever.encode(load_queries(queries_path), use_cache=False)
+    ids = np.arange(len(vectors), dtype='int64')
+    print(f"--- ANN Evaluation: {len(vectors)} vectors (d={vectors.shape[1]}), {len(queries)} queries, recall@{k} vs flat ---")
+    # Compressed types are measured twice: on their codes alone, then re-scoring
+    # rescore_factor * k candidates from a memory-mapped float32 side file (disk MB)
+    side_dir = tempfile.TemporaryDirectory()
+    full_vectors = write_full_vectors(os.path.join(side_dir.name, "vectors.npy"), ids, vectors)
+    side_mb = (os.path.getsize(full_vectors.path) + os.path.getsize(full_vectors.keys_path)) / 1e6
+
+    exact = None
+    print(f"{'index':>10} {'params':>14} {'rescore':>8} {'build s':>8} {'memory MB':>10} {'disk MB':>8} {'recall':>7} {'p50 ms':>7} {'p95 ms':>7}")
+    for index_type in ["flat"] + [t for t in index_types if t != "flat"]:
+        start = time.perf_counter()
+        index = create_index(index_type, vectors)
+        index.add_with_ids(vectors, ids)
+        build_time = time.perf_counter() - start
+        memory = index_memory_bytes(index) / 1e6
+
+        for params in SEARCH_SWEEPS[index_type]:
+            set_search_params(index, **params)
+            label = ", ".join(f"{name}={value}" for name, value in params.items()) or "-"
+            for side_file in ([None, full_vectors] if index_type in COMPRESSED_TYPES else [None]):
+                results, latencies = time_queries(index, queries, k, side_file, rescore_factor)
+                if exact is None:
+                    exact = results
+                rescored = f"{rescore_factor}x" if side_file is not None else "-"
+                disk = side_mb if side_file is not None else 0.0
+                print(f"{index_type:>10} {label:>14} {rescored:>8} {build_time:8.2f} {memory:10.1f} {disk:8.1f} "
+                      f"{recall_at_k(results, exact):7.3f} {np.percentile(latencies, 50):7.3f} {np.percentile(latencies, 95):7.3f}")
+    side_dir.cleanup()
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Recall, latency, build time and memory of the FAISS index types against exact search.")
+    arg_parser.add_argument("--knowledge-base", default="data/knowledge_base.jsonl")
+    arg_parser.add_argument("--queries", default="leaderboard_queries.json")
+    arg_parser.add_argument("--model", default="BAAI/bge-small-en-v1.5")
+    arg_parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    arg_parser.add_argument("--k", type=int, default=10)
+    arg_parser.add_argument("--limit", type=int, default=None, help="Only index the first N chunks")
+    arg_parser.add_argument("--rescore-factor", type=int, default=4, help="Candidates re-scored per result for compressed types")
+    args = arg_parser.parse_args()
+    run(args.knowledge_base, args.queries, args.model, args.types, args.k, args.limit, args.rescore_factor)
@@ -0,0 +1,107 @@
+import math
+import numpy as np
+import faiss
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq", "sq8", "fp16", "pca")
+# Types whose stored codes only approximate the embeddings; their candidates are
+# re-scored against full-precision vectors (see RAG/rescoring.py)
+COMPRESSED_TYPES = ("ivf_pq", "sq8", "fp16", "pca")
+
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+
+def default_nlist(n_vectors):
+    # ~4 sqrt(n) lists, but never so many that a list gets fewer than ~39 training points (faiss' own floor)
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+def default_pq_m(dimension):
+    # Largest sub-quantizer count <= d / 8 that divides d, i.e. ~8 dimensions per byte
+    for m in range(max(1, dimension // 8), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+def _training_sample(vectors, size, seed=0):
+    if len(vectors) <= size:
+        return vectors
+    rows = np.random.default_rng(seed).choice(len(vectors), size=size, replace=False)
+    return vectors[np.sort(rows)]
+
+def create_index(index_type, vectors, nlist=None, pq_m=None, pq_bits=8, hnsw_m=32, ef_construction=200,
+                 pca_dim=None, train_size=50000):
+    """
+    Returns an empty, trained faiss index for inner-product search, wrapped in an
+    IndexIDMap2 so vectors are addressed by chunk key. IVF coarse quantizers and
+    PQ codebooks are trained on a random sample of at most train_size vectors;
+    nothing is added to the index.
+    """
+    dimension = vectors.shape[1]
+    if index_type == "flat":
+        inner = faiss.IndexFlatIP(dimension)
+    elif index_type == "hnsw":
+        inner = faiss.IndexHNSWFlat(dimension, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        inner.hnsw.efConstruction = ef_construction
+    elif index_type in ("sq8", "fp16"):
+        # One byte (sq8, per-dimension ranges trained on the sample) or two bytes (fp16) per dimension
+        qtype = faiss.ScalarQuantizer.QT_8bit if index_type == "sq8" else faiss.ScalarQuantizer.QT_fp16
+        inner = faiss.IndexScalarQuantizer(dimension, qtype, faiss.METRIC_INNER_PRODUCT)
+        inner.train(_training_sample(vectors, train_size))
+    elif index_type == "pca":
+        # Projection onto the top pca_dim principal components (a quarter of the dimensions by default)
+        pca_dim = pca_dim or max(1, dimension // 4)
+        pca, flat = faiss.PCAMatrix(dimension, pca_dim), faiss.IndexFlatIP(pca_dim)
+        inner = faiss.IndexPreTransform(pca, flat)
+        # As for the IVF quantizer below, the C++ index owns its parts
+        inner.own_fields = True
+        pca.this.disown()
+        flat.this.disown()
+        inner.train(_training_sample(vectors, train_size))
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        nlist = nlist or default_nlist(len(vectors))
+        quantizer = faiss.IndexFlatIP(dimension)
+        if index_type == "ivf_flat":
+            inner = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            # Each PQ codebook needs at least 2^bits training points
+            pq_bits = min(pq_bits, int(math.log2(len(vectors))))
+            inner = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m or default_pq_m(dimension), pq_bits,
+                                     faiss.METRIC_INNER_PRODUCT)
+        # Ownership moves to the C++ side so the quantizer lives exactly as long as the index
+        inner.own_fields = True
+        quantizer.this.disown()
+        inner.train(_training_sample(vectors, max(train_size, nlist * 39)))
+    else:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {', '.join(INDEX_TYPES)}")
+    index = faiss.IndexIDMap2(inner)
+    index.own_fields = True
+    inner.this.disown()
+    return index
+
+def index_type_of(index):
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else faiss.downcast_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexPreTransform):
+        return "pca"
+    if isinstance(inner, faiss.IndexScalarQuantizer):
+        return "sq8" if inner.sq.qtype == faiss.ScalarQuantizer.QT_8bit else "fp16"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+def set_search_params(index, nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH):
+    """Applies the query-time knobs: nprobe for IVF indexes, efSearch for HNSW. Flat indexes ignore both."""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else faiss.downcast_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = min(nprobe, inner.nlist)
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = ef_search
+
+def supports_remove(index):
+    return index_type_of(index) != "hnsw"
+
+def index_memory_bytes(index):
+    """Size of the serialized index, a close proxy for its resident memory."""
+    return faiss.serialize_index(index).nbytes
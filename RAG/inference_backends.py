@@ -0,0 +1,75 @@
+import os
+
+# torch: fp32 PyTorch (GPU when available). int8: PyTorch with nn.Linear weights
+# dynamically quantized to int8. onnx / onnx-int8: ONNX Runtime on CPU, optionally
+# with int8 dynamic quantization; these need the onnxruntime and onnx packages.
+BACKENDS = ("torch", "int8", "onnx", "onnx-int8")
+
+class OnnxEncoder:
+    """
+    Runs an ONNX export of a HuggingFace encoder with ONNX Runtime, returning
+    outputs shaped like the PyTorch model's so DenseRetriever can pool them the
+    same way. Exports are cached under export_dir and reused.
+    """
+    def __init__(self, model_name, tokenizer, quantize=False, export_dir="data/onnx"):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("The 'onnx' backends need onnxruntime and onnx: pip install onnxruntime onnx")
+
+        from transformers import AutoConfig
+        # Only the config is needed once an export exists; the PyTorch weights load just to export
+        self.config = AutoConfig.from_pretrained(model_name)
+        model_dir = os.path.join(export_dir, model_name.strip("/").replace("/", "__"))
+        path = os.path.join(model_dir, "model.onnx")
+        if not os.path.exists(path):
+            self._export(model_name, tokenizer, path)
+        if quantize:
+            quantized_path = os.path.join(model_dir, "model.int8.onnx")
+            if not os.path.exists(quantized_path):
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                print(f"Quantizing {path} to int8...")
+                quantize_dynamic(path, quantized_path + ".tmp", weight_type=QuantType.QInt8)
+                os.replace(quantized_path + ".tmp", quantized_path)
+            path = quantized_path
+
+        self.session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+    def _export(self, model_name, tokenizer, path):
+        import torch
+        from transformers import AutoModel
+        print(f"Exporting {model_name} to ONNX at {path}...")
+        model = AutoModel.from_pretrained(model_name).eval()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        dummy = dict(tokenizer(["an example passage", "a second, longer example passage"], padding=True, return_tensors='pt'))
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in list(dummy) + ["last_hidden_state"]}
+        with torch.no_grad():
+            torch.onnx.export(model, (), path + ".tmp", kwargs=dummy, input_names=list(dummy),
+                              output_names=["last_hidden_state"], dynamic_axes=dynamic_axes, opset_version=17,
+                              dynamo=False)
+        os.replace(path + ".tmp", path)
+
+    def to(self, device):
+        return self
+
+    def __call__(self, **inputs):
+        import torch
+        feeds = {name: tensor.cpu().numpy() for name, tensor in inputs.items() if name in self.input_names}
+        (last_hidden_state,) = self.session.run(["last_hidden_state"], feeds)
+        return (torch.from_numpy(last_hidden_state),)
+
+def load_encoder(model_name, tokenizer, backend="torch", export_dir="data/onnx"):
+    """Returns (model, device) for the requested backend; every backend except 'torch' runs on CPU."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    # torch and transformers take seconds to import, so they are only imported once a model is needed
+    import torch
+    from transformers import AutoModel
+    if backend == "torch":
+        device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+        return AutoModel.from_pretrained(model_name).to(device), device
+    if backend == "int8":
+        model = AutoModel.from_pretrained(model_name).eval()
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8), torch.device("cpu")
+    return OnnxEncoder(model_name, tokenizer, quantize=backend == "onnx-int8", export_dir=export_dir), torch.device("cpu")
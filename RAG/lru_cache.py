@@ -0,0 +1,61 @@
+import sys
+import threading
+from collections import OrderedDict
+
+def results_nbytes(results):
+    """Rough footprint of a list of search result dicts, dominated by their text."""
+    return sys.getsizeof(results) + sum(
+        sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r.values()) for r in results)
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by entry count and by the
+    summed sizes reported by nbytes(value). Hits and misses are counted.
+    """
+    def __init__(self, max_entries=1024, max_bytes=64 * 2**20, nbytes=sys.getsizeof):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = nbytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.nbytes(value)
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": len(self._entries), "bytes": self.bytes, "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from RAG.profiling import rss_mb
+
+# RAG.bm25_segments needs only numpy; it is listed to show which phase loads the sparse index code
+HEAVY_MODULES = ("torch", "transformers", "faiss", "nltk", "RAG.bm25_segments")
+
+class StartupProfile:
+    """Times consecutive cold-start phases in this process and notes which heavy modules each one pulled in."""
+    def __init__(self):
+        self.rows = []
+        self._start = time.perf_counter()
+
+    def phase(self, name, fn):
+        before = {m for m in HEAVY_MODULES if m in sys.modules}
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        imported = sorted({m for m in HEAVY_MODULES if m in sys.modules} - before)
+        self.rows.append((name, elapsed, time.perf_counter() - self._start, rss_mb(), imported))
+        return result
+
+    def report(self):
+        print(f"\n{'phase':<34} {'seconds':>8} {'cumulative':>11} {'RSS MB':>8}  newly imported")
+        for name, elapsed, cumulative, rss, imported in self.rows:
+            print(f"{name:<34} {elapsed:8.2f} {cumulative:11.2f} {rss:8.0f}  {', '.join(imported)}")
+
+def run(model_name="BAAI/bge-small-en-v1.5", query="What was the original purpose of the Carnegie Technical Schools?"):
+    # Must run in a fresh interpreter: anything imported before this point is not attributed to a phase
+    profile = StartupProfile()
+    dense_module = profile.phase("import RAG.document_query_embedder", lambda: __import__("RAG.document_query_embedder", fromlist=["*"]))
+    sparse_module = profile.phase("import RAG.sparse_embedder", lambda: __import__("RAG.sparse_embedder", fromlist=["*"]))
+
+    dense = profile.phase("DenseRetriever()", lambda: dense_module.DenseRetriever(model_name=model_name))
+    if profile.phase("dense load_index()", dense.load_index):
+        profile.phase("dense tokenizer load", lambda: dense.tokenizer)
+        profile.phase("dense model load", dense.load_model)
+        profile.phase("dense first search", lambda: dense.search(query))
+        profile.phase("dense repeat search (cached)", lambda: dense.search(query))
+    else:
+        print("No dense index found; skipping dense search phases")
+
+    sparse = profile.phase("SparseRetriever()", sparse_module.SparseRetriever)
+    if profile.phase("sparse load_index()", sparse.load_index):
+        profile.phase("sparse first search", lambda: sparse.search(query))
+        profile.phase("sparse second search", lambda: sparse.search(query))
+    else:
+        print("No BM25 index found; skipping sparse search phases")
+    profile.report()
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Break down retriever cold-start time by phase.")
+    arg_parser.add_argument("--model", default="BAAI/bge-small-en-v1.5")
+    args = arg_parser.parse_args()
+    run(args.model)
@@ -0,0 +1,25 @@
+import os
+import sys
+
+def rss_mb():
+    """Current resident set size of this process in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+def private_rss_mb():
+    """
+    Resident memory not backed by files, i.e. what another process loading the
+    same data could not share. Falls back to rss_mb() where /proc is unavailable.
+    """
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            fields = f.read().split()
+        return (int(fields[1]) - int(fields[2])) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        return rss_mb()
@@ -0,0 +1,73 @@
+import os
+import numpy as np
+
+class FullPrecisionVectors:
+    """
+    float32 embeddings kept next to a compressed FAISS index, for exact
+    re-scoring of its candidates. Rows are sorted by chunk key and saved as two
+    .npy files that are opened memory-mapped, so only the rows of candidates a
+    query actually touches are paged in.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.keys_path = keys_path_for(path)
+        self.keys = np.load(self.keys_path, mmap_mode='r')
+        self.vectors = np.load(path, mmap_mode='r')
+
+    def __len__(self):
+        return len(self.keys)
+
+    def rows_for_keys(self, keys):
+        keys = np.asarray(keys, dtype='int64')
+        if len(self.keys) == 0:
+            return np.full(keys.shape, -1, dtype='int64')
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[positions] == keys, positions, -1)
+
+    def updated(self, added_keys, added_vectors, removed_keys):
+        """Writes a new side file with rows added and removed, and returns it opened."""
+        keep = ~np.isin(self.keys, np.asarray(list(removed_keys), dtype='int64'))
+        added_keys = np.asarray(added_keys, dtype='int64')
+        keys = np.concatenate([self.keys[keep], added_keys])
+        # Shaped from the side file's width, since a removal-only update has no rows to infer it from
+        added_vectors = np.asarray(added_vectors, dtype='float32').reshape(len(added_keys), self.vectors.shape[1])
+        vectors = np.concatenate([self.vectors[keep], added_vectors])
+        return write_full_vectors(self.path, keys, vectors)
+
+def keys_path_for(path):
+    return os.path.splitext(path)[0] + ".keys.npy"
+
+def write_full_vectors(path, keys, vectors):
+    keys = np.asarray(keys, dtype='int64')
+    # Keys are unique per chunk; keep the last vector written for any repeated key
+    order = np.argsort(keys, kind='stable')
+    keys, vectors = keys[order], np.asarray(vectors, dtype='float32')[order]
+    last = np.append(keys[1:] != keys[:-1], True) if len(keys) else np.zeros(0, dtype=bool)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    for target, data in ((keys_path_for(path), keys[last]), (path, vectors[last])):
+        tmp_path = target + ".tmp.npy"
+        np.save(tmp_path, data)
+        os.replace(tmp_path, target)
+    return FullPrecisionVectors(path)
+
+def rescore(query_vectors, candidate_ids, full_vectors, top_k):
+    """
+    Re-ranks each query's candidates by exact inner product against the
+    full-precision vectors. Candidates missing from the side file keep a score
+    of -inf and sink to the end. Returns (scores, ids) shaped (queries, top_k).
+    """
+    rows = full_vectors.rows_for_keys(candidate_ids)
+    scores = np.full(candidate_ids.shape, -np.inf, dtype='float32')
+    valid = (candidate_ids != -1) & (rows >= 0)
+    for i in range(len(candidate_ids)):
+        query_rows = rows[i][valid[i]]
+        if len(query_rows):
+            # Sorted row order keeps reads from the memory map sequential
+            order = np.argsort(query_rows)
+            exact = np.asarray(full_vectors.vectors[query_rows[order]]) @ query_vectors[i]
+            scores[i, np.flatnonzero(valid[i])[order]] = exact
+
+    best = np.argsort(-scores, axis=1, kind='stable')[:, :top_k]
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    best_ids = np.where(np.isfinite(best_scores), np.take_along_axis(candidate_ids, best, axis=1), -1)
+    return best_scores, best_ids
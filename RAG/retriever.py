@@ -1,13 +1,50 @@
 import os
 import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from data_pipeline.chunker import chunk_text
 from RAG.sparse_embedder import SparseRetriever
 from RAG.document_query_embedder import DenseRetriever
 
+# Threads per leg: one for the current search plus one a timed-out search may still hold
+LEG_THREADS = 2
+
 class HybridRetriever:
-    def __init__(self, dense_retriever: DenseRetriever, sparse_retriever: SparseRetriever):
+    def __init__(self, dense_retriever: DenseRetriever, sparse_retriever: SparseRetriever, concurrent=True,
+                 leg_timeout=None):
+        """
+        With concurrent=True the dense and sparse legs of a search run on
+        separate threads (both spend most of their time in native code that
+        releases the GIL), so latency approaches the slower leg rather than the
+        sum. leg_timeout (seconds) is the default per-leg deadline: a leg that
+        misses it contributes no results and fusion uses the other leg alone.
+        Call close() (or use the retriever as a context manager) to stop the
+        leg threads.
+        """
         self.dense = dense_retriever
         self.sparse = sparse_retriever
+        self.concurrent = concurrent
+        self.leg_timeout = leg_timeout
+        self.last_timings = None
+        # A leg that times out keeps running in the background. Each leg only starts while it has a
+        # free slot, so stuck legs are skipped as degraded instead of piling up behind each other,
+        # and a stuck dense leg never takes the sparse leg's threads
+        self._leg_slots = {name: threading.BoundedSemaphore(LEG_THREADS) for name in ("dense", "sparse")}
+        self._executor = ThreadPoolExecutor(max_workers=LEG_THREADS * len(self._leg_slots),
+                                            thread_name_prefix="hybrid-leg") if concurrent else None
+
+    def close(self):
+        """Stops the leg threads without waiting for legs still running; later searches run their legs in turn."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def reciprocal_rank_fusion(self, dense_results, sparse_results, k=60, top_k=5):
         """
@@ -83,12 +120,7 @@ class HybridRetriever:
         
         return fused_results[:top_k]
 
-    def search(self, query: str, top_k: int = 5, method="rrf"):
-        candidate_count = max(top_k * 2, 20)
-        
-        dense_results = self.dense.search(query, top_k=candidate_count)
-        sparse_results = self.sparse.search(query, top_k=candidate_count)
-        
+    def fuse(self, dense_results, sparse_results, top_k=5, method="rrf"):
         if method == "rrf":
             return self.reciprocal_rank_fusion(dense_results, sparse_results, top_k=top_k)
         elif method == "weighted":
@@ -96,6 +128,80 @@ class HybridRetriever:
         else:
             raise ValueError("Fusion method must be 'rrf' or 'weighted'.")
 
+    def _run_legs(self, dense_fn, sparse_fn, empty, timeout):
+        """
+        Runs both legs, concurrently if enabled, and returns (dense, sparse,
+        timings). A leg that misses the timeout counts as empty and is listed in
+        timings["degraded"]; timeouts need concurrent=True.
+        """
+        timeout = self.leg_timeout if timeout is None else timeout
+        start = time.perf_counter()
+        
+        def timed(fn):
+            leg_start = time.perf_counter()
+            result = fn()
+            return result, (time.perf_counter() - leg_start) * 1000
+        
+        legs = {"dense": dense_fn, "sparse": sparse_fn}
+        futures = {}
+        if self._executor is not None:
+            for name, fn in legs.items():
+                slots = self._leg_slots[name]
+                if slots.acquire(blocking=False):
+                    futures[name] = self._executor.submit(timed, fn)
+                    futures[name].add_done_callback(lambda _, slots=slots: slots.release())
+        outcomes = {}
+        timings = {"degraded": []}
+        for name, fn in legs.items():
+            try:
+                if self._executor is None:
+                    outcomes[name], timings[f"{name}_ms"] = timed(fn)
+                elif name not in futures:
+                    print(f"Hybrid search: {name} leg skipped, earlier timed-out {name} legs are still running")
+                    outcomes[name], timings[f"{name}_ms"] = empty, 0.0
+                    timings["degraded"].append(name)
+                else:
+                    # Both deadlines run from the start of the search, not from when the other leg finished
+                    remaining = None if timeout is None else max(0.0, timeout - (time.perf_counter() - start))
+                    outcomes[name], timings[f"{name}_ms"] = futures[name].result(timeout=remaining)
+            except FutureTimeoutError:
+                print(f"Hybrid search: {name} leg exceeded {timeout:.3f}s; using the other leg only")
+                outcomes[name], timings[f"{name}_ms"] = empty, (time.perf_counter() - start) * 1000
+                timings["degraded"].append(name)
+                futures[name].cancel()
+        timings["total_ms"] = (time.perf_counter() - start) * 1000
+        self.last_timings = timings
+        return outcomes["dense"], outcomes["sparse"], timings
+
+    def search(self, query: str, top_k: int = 5, method="rrf", timeout=None, return_timings=False):
+        """
+        Fused results for query. With return_timings=True returns (results,
+        timings), where timings holds dense_ms, sparse_ms, total_ms and the
+        legs that timed out.
+        """
+        candidate_count = max(top_k * 2, 20)
+        
+        dense_results, sparse_results, timings = self._run_legs(
+            lambda: self.dense.search(query, top_k=candidate_count),
+            lambda: self.sparse.search(query, top_k=candidate_count),
+            [], timeout)
+        
+        results = self.fuse(dense_results, sparse_results, top_k=top_k, method=method)
+        return (results, timings) if return_timings else results
+
+    def search_batch(self, queries, top_k: int = 5, method="rrf", timeout=None, return_timings=False):
+        """search() for many queries; each leg scores them all in one batched call."""
+        candidate_count = max(top_k * 2, 20)
+        
+        dense_batch, sparse_batch, timings = self._run_legs(
+            lambda: self.dense.search_batch(queries, top_k=candidate_count),
+            lambda: self.sparse.search_batch(queries, top_k=candidate_count),
+            [[] for _ in queries], timeout)
+        
+        results = [self.fuse(dense_results, sparse_results, top_k=top_k, method=method)
+                   for dense_results, sparse_results in zip(dense_batch, sparse_batch)]
+        return (results, timings) if return_timings else results
+
 if __name__ == "__main__":
     print("Loading Dense Retriever...")
     dense = DenseRetriever()
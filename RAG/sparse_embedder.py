@@ -1,101 +1,289 @@
 import os
+import re
 import json
-import bm25s
-import nltk
-from nltk.stem import PorterStemmer
-from nltk.corpus import stopwords
+import time
+import threading
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from data_pipeline.chunk_store import chunk_key, open_chunk_store, update_chunk_store
+from data_pipeline.nltk_resources import require_nltk_resource
+from RAG.bm25_segments import SegmentedBM25
 
-nltk.download('stopwords', quiet=True)
+# bm25s.tokenize's default pattern, so indexes built before tokenization moved here match token for token
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+STEM_CACHE_FILE = "stem_cache.json"
+# Below this many chunks starting worker processes costs more than it saves
+PARALLEL_MIN_TEXTS = 20000
+LEGACY_INDEX_FILES = ("data.csc.index.npy", "indices.csc.index.npy", "indptr.csc.index.npy", "vocab.index.json",
+                      "params.index.json", "nonoccurrence_array.index.npy", "doc_keys.npy", "mapping.json")
+
+def tokenize_texts(texts, stopwords, stem_cache, stem, add_stems=True):
+    """
+    Lowercases, splits and drops stopwords as bm25s.tokenize does, then stems
+    through stem_cache so each distinct word is stemmed once. New stems are
+    added to stem_cache unless add_stems is False.
+    """
+    corpus_tokens = []
+    for text in texts:
+        tokens = []
+        for word in TOKEN_PATTERN.findall(text.lower()):
+            if word in stopwords:
+                continue
+            stemmed = stem_cache.get(word)
+            if stemmed is None:
+                stemmed = stem(word)
+                if add_stems:
+                    stem_cache[word] = stemmed
+            tokens.append(stemmed)
+        corpus_tokens.append(tokens)
+    return corpus_tokens
+
+def _tokenize_worker(texts, stopwords, stem_cache):
+    from nltk.stem import PorterStemmer
+    known = len(stem_cache)
+    corpus_tokens = tokenize_texts(texts, stopwords, stem_cache, PorterStemmer().stem)
+    # Dicts keep insertion order, so the stems this worker added are the tail
+    return corpus_tokens, dict(list(stem_cache.items())[known:])
+
+class SparseResults:
+    """
+    BM25 results for a batch of queries, aligned with the input order. scores
+    and chunk_keys are (queries, top_k) arrays, best first. Indexing or iterating
+    yields one query's results as dicts; records are only read from the chunk
+    store at that point.
+    """
+    def __init__(self, store, chunk_keys, scores):
+        self.store = store
+        self.chunk_keys = chunk_keys
+        self.scores = scores
+        self.rows = store.rows_for_keys(chunk_keys)
+
+    def __len__(self):
+        return len(self.chunk_keys)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def __getitem__(self, i):
+        results = []
+        for row, score in zip(self.rows[i], self.scores[i]):
+            if row >= 0:
+                doc = self.store.record(row)
+                results.append({
+                    "score": float(score),
+                    "chunk_id": doc.get('id'),
+                    "source": doc.get('source'),
+                    "text": doc.get('text')
+                })
+        return results
+
+    def texts(self, i):
+        return [self.store.text(row) for row in self.rows[i] if row >= 0]
 
 class SparseRetriever:
-    def __init__(self, index_dir="data/bm25_index"):
+    def __init__(self, index_dir="data/bm25_index", store_path="data/chunk_store.bin",
+                 knowledge_base_path="data/knowledge_base.jsonl", mmap=False, background_merge=True):
         self.index_dir = index_dir
-        self.retriever = None
-        self.id_to_doc = {}
+        self.store_path = store_path
+        self.knowledge_base_path = knowledge_base_path
+        # Memory-map the segments' postings read-only instead of reading them into RAM, so
+        # processes serving the same index share their pages through the OS page cache
+        self.mmap = mmap
+        # Segment merges triggered by updates run on a thread while searches continue
+        self.background_merge = background_merge
+        self._merge_thread = None
+        self.index = None
+        self.store = None
         
-        self.stemmer = PorterStemmer()
-        self.stopwords = set(stopwords.words('english'))
+        # Loaded on first tokenization; importing nltk alone takes over a second
+        self._stemmer = None
+        self._stopwords = None
+        # word -> Porter stem, persisted with the index along with the stopwords it was built with,
+        # so queries made of already-seen words never touch nltk
+        self.stem_cache = {}
 
-    def _stem_words(self, words):
-        return [self.stemmer.stem(w) for w in words]
+    @property
+    def stemmer(self):
+        if self._stemmer is None:
+            from nltk.stem import PorterStemmer
+            self._stemmer = PorterStemmer()
+        return self._stemmer
 
-    def _tokenize(self, texts):
-        return bm25s.tokenize(
-            texts, 
-            stopwords=list(self.stopwords), 
-            stemmer=self._stem_words
-        )
+    @property
+    def stopwords(self):
+        if self._stopwords is None:
+            require_nltk_resource("stopwords")
+            from nltk.corpus import stopwords
+            self._stopwords = frozenset(stopwords.words('english'))
+        return self._stopwords
 
-    def build_index(self, knowledge_base_path="data/knowledge_base.jsonl"):
-        print("Reading knowledge base for BM25...")
-        texts = []
-        doc_ids = []
+    def _stem(self, word):
+        return self.stemmer.stem(word)
+
+    def _tokenize(self, texts, workers=1, add_stems=True):
+        if workers <= 1 or len(texts) < PARALLEL_MIN_TEXTS:
+            return tokenize_texts(texts, self.stopwords, self.stem_cache, self._stem, add_stems)
         
-        with open(knowledge_base_path, 'r', encoding='utf-8') as f:
-            for i, line in enumerate(f):
-                record = json.loads(line)
-                texts.append(record['text'])
-                doc_ids.append(record)
-                self.id_to_doc[i] = record
-                
+        # Each worker starts from the cached stems and hands back the ones it had to compute
+        shard_size = -(-len(texts) // (workers * 4))
+        shards = [texts[i:i + shard_size] for i in range(0, len(texts), shard_size)]
+        corpus_tokens = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for shard_tokens, new_stems in executor.map(_tokenize_worker, shards, [self.stopwords] * len(shards),
+                                                        [self.stem_cache] * len(shards)):
+                corpus_tokens.extend(shard_tokens)
+                self.stem_cache.update(new_stems)
+        return corpus_tokens
+
+    def _load_stem_cache(self):
+        path = os.path.join(self.index_dir, STEM_CACHE_FILE)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            self._stopwords = frozenset(cached["stopwords"])
+            self.stem_cache = cached["stems"]
+
+    def _save_stem_cache(self):
+        path = os.path.join(self.index_dir, STEM_CACHE_FILE)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump({"stopwords": sorted(self.stopwords), "stems": self.stem_cache}, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def _tokenize_logged(self, texts, workers):
         print(f"Tokenizing {len(texts)} chunks for sparse retrieval with NLTK stemming...")
-        corpus_tokens = self._tokenize(texts)
+        start = time.perf_counter()
+        known = len(self.stem_cache)
+        corpus_tokens = self._tokenize(texts, workers)
+        print(f"Tokenized in {time.perf_counter() - start:.2f}s ({len(self.stem_cache) - known} new stems, "
+              f"{known} reused)")
+        return corpus_tokens
+
+    def build_index(self, knowledge_base_path=None, workers=None):
+        """
+        Tokenizes every chunk and rebuilds the BM25 index as a single segment.
+        Stems cached by a previous build are reused; at least PARALLEL_MIN_TEXTS
+        chunks are tokenized across workers processes (default: one per CPU).
+        """
+        print("Reading knowledge base for BM25...")
+        self.store = open_chunk_store(self.store_path, knowledge_base_path or self.knowledge_base_path,
+                                      rebuild=knowledge_base_path is not None)
+        texts = [self.store.text(row) for row in range(len(self.store))]
+                
+        self._load_stem_cache()
+        corpus_tokens = self._tokenize_logged(texts, workers or os.cpu_count() or 1)
         
         print("Building BM25 index...")
-        self.retriever = bm25s.BM25()
-        self.retriever.index(corpus_tokens)
+        self.index = SegmentedBM25(self.index_dir, mmap=self.mmap)
+        # BM25 documents carry their chunk keys; results are resolved to chunk store rows through them
+        self.index.rebuild(self.store.all_keys(), corpus_tokens)
         
         self.save_index()
         print(f"BM25 Index successfully built and saved to {self.index_dir}!")
 
+    def update_index(self, added_records=(), removed_chunk_ids=()):
+        """
+        Indexes only added_records, as a new segment, and marks the documents
+        of removed_chunk_ids deleted. Records already indexed are skipped.
+        """
+        added_records = list(added_records)
+        removed_keys = [chunk_key(chunk_id) for chunk_id in removed_chunk_ids]
+        # Search results are decoded from the chunk store, so new records have to be written there first
+        self.store = update_chunk_store(self.store_path, added_records, removed_keys)
+        return self._apply_changes([chunk_key(record['id']) for record in added_records],
+                                   [record['text'] for record in added_records], removed_keys)
+
+    def update_from_knowledge_base(self, knowledge_base_path=None):
+        """Brings a loaded index in line with the knowledge base, tokenizing only new chunks."""
+        self.store = open_chunk_store(self.store_path, knowledge_base_path or self.knowledge_base_path,
+                                      rebuild=knowledge_base_path is not None)
+        current = self.store.all_keys()
+        indexed = self.index.live_keys()
+        added_rows = np.flatnonzero(~np.isin(current, indexed))
+        
+        self._apply_changes(current[added_rows].tolist(), [self.store.text(row) for row in added_rows],
+                            np.setdiff1d(indexed, current).tolist())
+
+    def _apply_changes(self, added_keys, added_texts, removed_keys):
+        start = time.perf_counter()
+        deleted = self.index.delete(removed_keys) if removed_keys else 0
+        
+        indexed = np.isin(np.asarray(added_keys, dtype='int64'), self.index.live_keys())
+        added = [(key, text) for key, text, present in zip(added_keys, added_texts, indexed) if not present]
+        if added:
+            corpus_tokens = self._tokenize_logged([text for _, text in added], workers=1)
+            self.index.add([key for key, _ in added], corpus_tokens)
+            self.save_index()
+        print(f"BM25 index updated in {time.perf_counter() - start:.2f}s: {len(added)} chunks added, {deleted} removed, "
+              f"{len(self.index.segments)} segments")
+        self.maybe_merge()
+
+    def maybe_merge(self):
+        """Starts merge_segments() on a background thread if the index needs one and none is running."""
+        if not self.index.segments_to_merge() or (self._merge_thread is not None and self._merge_thread.is_alive()):
+            return None
+        if not self.background_merge:
+            self.merge_segments()
+            return None
+        self._merge_thread = threading.Thread(target=self.merge_segments, name="bm25-merge", daemon=True)
+        self._merge_thread.start()
+        return self._merge_thread
+
+    def merge_segments(self, segments=None):
+        start = time.perf_counter()
+        if self.index.merge(segments):
+            print(f"Merged BM25 segments in {time.perf_counter() - start:.2f}s ({len(self.index.segments)} remaining)")
+
+    def wait_for_merge(self):
+        if self._merge_thread is not None:
+            self._merge_thread.join()
+
     def save_index(self):
         os.makedirs(self.index_dir, exist_ok=True)
-        self.retriever.save(self.index_dir)
+        self._save_stem_cache()
         
-        map_path = os.path.join(self.index_dir, "mapping.json")
-        with open(map_path, 'w', encoding='utf-8') as f:
-            json.dump(self.id_to_doc, f, ensure_ascii=False, indent=2)
+        # Superseded by the segments: a bm25s score matrix, its doc_keys.npy or the older mapping.json
+        for name in LEGACY_INDEX_FILES:
+            legacy_path = os.path.join(self.index_dir, name)
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
 
     def load_index(self):
-        if os.path.exists(self.index_dir):
+        if SegmentedBM25.exists(self.index_dir):
             try:
-                self.retriever = bm25s.BM25.load(self.index_dir, load_corpus=False)
-                
-                map_path = os.path.join(self.index_dir, "mapping.json")
-                with open(map_path, 'r', encoding='utf-8') as f:
-                    raw_mapping = json.load(f)
-                    self.id_to_doc = {int(k): v for k, v in raw_mapping.items()}
+                self.index = SegmentedBM25(self.index_dir, mmap=self.mmap)
+                self.index.load()
+                self._load_stem_cache()
+                self.store = open_chunk_store(self.store_path, self.knowledge_base_path)
                 return True
             except Exception as e:
                 print(f"Failed to load BM25 index: {e}")
                 return False
+        if os.path.exists(self.index_dir):
+            # bm25s indexes keep only precomputed scores, so they cannot be split into segments
+            print(f"BM25 index at {self.index_dir} predates segmented indexes; rebuilding it")
+            self.build_index()
+            return True
         return False
 
     def search(self, query: str, top_k: int = 5):
-        if self.retriever is None:
+        return self.search_batch([query], top_k=top_k, n_threads=0)[0]
+
+    def search_batch(self, queries, top_k: int = 5, n_threads: int = -1):
+        """
+        Scores all queries against every segment, split across n_threads
+        threads (-1: one per CPU, 0: the calling thread only). Returns a
+        SparseResults aligned with queries.
+        """
+        if self.index is None:
             if not self.load_index():
                 raise FileNotFoundError("BM25 index not found. Please run build_index() first.")
                 
-        query_tokens = self._tokenize([query])
+        # Query words are stemmed without caching them, so arbitrary queries cannot grow the saved stem cache
+        query_tokens = self._tokenize(list(queries), add_stems=False)
         
-        results_obj = self.retriever.retrieve(query_tokens, k=top_k)
-        
-        doc_indices = results_obj.documents[0]
-        doc_scores = results_obj.scores[0]
-        
-        results = []
-        for idx, score in zip(doc_indices, doc_scores):
-            idx = int(idx)
-            if idx in self.id_to_doc:
-                doc = self.id_to_doc[idx]
-                results.append({
-                    "score": float(score),
-                    "chunk_id": doc.get('id'),
-                    "source": doc.get('source'),
-                    "text": doc.get('text')
-                })
-                
-        return results
+        chunk_keys, scores = self.index.search(query_tokens, top_k=top_k, n_threads=n_threads)
+        # Only the top-k rows of each query are decoded from the chunk store, and only when accessed
+        return SparseResults(self.store, chunk_keys, scores)
 
 if __name__ == "__main__":
     sparse_retriever = SparseRetriever()
@@ -0,0 +1,37 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from RAG.rescoring import write_full_vectors
+
+class FullPrecisionVectorsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "vectors.npy")
+        self.vectors = np.arange(12, dtype='float32').reshape(4, 3)
+        self.full = write_full_vectors(self.path, [40, 10, 30, 20], self.vectors)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_removal_only_update(self):
+        updated = self.full.updated([], np.zeros((0, 3), dtype='float32'), [10, 30])
+        self.assertEqual(list(updated.keys), [20, 40])
+        np.testing.assert_array_equal(updated.vectors, self.vectors[[3, 0]])
+
+    def test_removal_only_update_without_vectors(self):
+        updated = self.full.updated([], [], [40])
+        self.assertEqual(list(updated.keys), [10, 20, 30])
+        self.assertEqual(updated.vectors.shape, (3, 3))
+
+    def test_add_and_remove(self):
+        updated = self.full.updated([50], [[1, 2, 3]], [20])
+        self.assertEqual(list(updated.keys), [10, 30, 40, 50])
+        np.testing.assert_array_equal(updated.vectors[-1], [1, 2, 3])
+
+if __name__ == '__main__':
+    unittest.main()
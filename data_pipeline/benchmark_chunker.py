@@ -0,0 +1,106 @@
+import os
+import sys
+import glob
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nltk
+from data_pipeline.parser import parse_html_to_text
+from data_pipeline.chunker import chunk_text, load_tokenizer
+
+def legacy_chunk_text(text: str, chunk_size: int = 300, overlap: int = 50) -> list[str]:
+    """The original word-counting chunker, kept verbatim as the benchmark baseline."""
+    sentences = nltk.tokenize.sent_tokenize(text)
+    chunks = []
+
+    if not sentences:
+        return chunks
+
+    current_chunk = []
+    current_length = 0
+
+    for sentence in sentences:
+        sentence_words = len(sentence.split())
+
+        if current_length + sentence_words > chunk_size and current_chunk:
+            chunks.append(" ".join(current_chunk))
+
+            overlap_words = 0
+            overlap_chunk = []
+            for s in reversed(current_chunk):
+                s_words = len(s.split())
+                if overlap_words + s_words > overlap:
+                    break
+                overlap_chunk.insert(0, s)
+                overlap_words += s_words
+
+            current_chunk = overlap_chunk
+            current_length = sum(len(s.split()) for s in current_chunk)
+
+        current_chunk.append(sentence)
+        current_length += sentence_words
+
+    if current_chunk:
+        chunks.append(" ".join(current_chunk))
+
+    return chunks
+
+def time_chunker(name, fn, texts, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        outputs = [fn(text) for text in texts]
+        best = min(best, time.perf_counter() - start)
+    n_chunks = sum(len(chunks) for chunks in outputs)
+    print(f"{name:>28}: {best:7.3f}s  {n_chunks:6d} chunks")
+    return outputs
+
+def token_report(name, outputs, tokenizer):
+    lengths = [len(ids) for chunks in outputs if chunks
+               for ids in tokenizer([c for c in chunks], add_special_tokens=True)["input_ids"]]
+    over = sum(1 for n in lengths if n > tokenizer.model_max_length)
+    print(f"{name:>28}: max {max(lengths)} tokens, mean {sum(lengths) / len(lengths):.0f}, "
+          f"{over}/{len(lengths)} chunks over the {tokenizer.model_max_length}-token window")
+
+def run(data_dir="baseline_data", word_size=150, word_overlap=30, token_size=200, token_overlap=40,
+        tokenizer_name="BAAI/bge-small-en-v1.5", repeats=3):
+    files = sorted(glob.glob(os.path.join(data_dir, "*.htm")) + glob.glob(os.path.join(data_dir, "*.html")))
+    texts = []
+    for filepath in files:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            texts.append(parse_html_to_text(f.read()))
+    print(f"--- Chunker Benchmark on {len(texts)} documents ({sum(len(t) for t in texts) / 1e6:.1f} M chars) ---")
+
+    # Sentence splitting is shared by every variant, so time it separately
+    start = time.perf_counter()
+    for text in texts:
+        nltk.tokenize.sent_tokenize(text)
+    print(f"{'sent_tokenize only':>28}: {time.perf_counter() - start:7.3f}s")
+
+    legacy = time_chunker("legacy (words)", lambda t: legacy_chunk_text(t, word_size, word_overlap), texts, repeats)
+    single_pass = time_chunker("single-pass (words)", lambda t: chunk_text(t, word_size, word_overlap), texts, repeats)
+    changed = sum(1 for a, b in zip(legacy, single_pass) if a != b)
+    print(f"Documents whose word chunks differ from legacy: {changed}/{len(texts)} "
+          f"(legacy lets overlap + next sentence exceed chunk_size)")
+
+    try:
+        tokenizer = load_tokenizer(tokenizer_name)
+    except Exception as e:
+        print(f"Skipping token-mode benchmark, could not load tokenizer '{tokenizer_name}': {e}")
+        return
+
+    tokens = time_chunker(f"single-pass ({token_size} tokens)",
+                          lambda t: chunk_text(t, token_size, token_overlap, tokenizer=tokenizer), texts, repeats)
+    print()
+    token_report("legacy (words)", legacy, tokenizer)
+    token_report(f"single-pass ({token_size} tokens)", tokens, tokenizer)
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Compare the single-pass chunker against the legacy implementation.")
+    arg_parser.add_argument("--data-dir", default="baseline_data")
+    arg_parser.add_argument("--tokenizer", default="BAAI/bge-small-en-v1.5")
+    arg_parser.add_argument("--repeats", type=int, default=3)
+    args = arg_parser.parse_args()
+    run(args.data_dir, tokenizer_name=args.tokenizer, repeats=args.repeats)
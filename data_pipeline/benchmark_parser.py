@@ -0,0 +1,73 @@
+import os
+import sys
+import glob
+import time
+import difflib
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_pipeline.parser import parse_html_to_text
+
+def word_similarity(a: str, b: str) -> float:
+    matcher = difflib.SequenceMatcher(None, a.split(), b.split(), autojunk=False)
+    return matcher.ratio()
+
+def first_difference(a: str, b: str, context: int = 60) -> str:
+    for i, (ca, cb) in enumerate(zip(a, b)):
+        if ca != cb:
+            break
+    else:
+        i = min(len(a), len(b))
+    return f"...{a[max(0, i - 20):i + context]!r}\n      vs ...{b[max(0, i - 20):i + context]!r}"
+
+def run(data_dir="baseline_data", reference="bs4", candidate="lxml", show_diffs=3):
+    files = sorted(glob.glob(os.path.join(data_dir, "*.htm")) + glob.glob(os.path.join(data_dir, "*.html")))
+    if not files:
+        print(f"No HTML files found in {data_dir}")
+        return
+
+    total_bytes = 0
+    elapsed = {reference: 0.0, candidate: 0.0}
+    identical = 0
+    mismatches = []
+
+    for filepath in files:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            html_content = f.read()
+        total_bytes += len(html_content.encode('utf-8'))
+
+        outputs = {}
+        for backend in (reference, candidate):
+            start = time.perf_counter()
+            outputs[backend] = parse_html_to_text(html_content, backend=backend)
+            elapsed[backend] += time.perf_counter() - start
+
+        if outputs[reference] == outputs[candidate]:
+            identical += 1
+        else:
+            similarity = word_similarity(outputs[reference], outputs[candidate])
+            mismatches.append((similarity, os.path.basename(filepath), outputs[reference], outputs[candidate]))
+
+    megabytes = total_bytes / 1e6
+    print(f"--- HTML Backend Parity: {reference} vs {candidate} on {len(files)} files ({megabytes:.1f} MB) ---")
+    for backend in (reference, candidate):
+        print(f"{backend:>6}: {elapsed[backend]:6.2f}s  {megabytes / elapsed[backend]:6.2f} MB/s")
+    print(f"Speedup: {elapsed[reference] / elapsed[candidate]:.1f}x")
+    print(f"Identical output: {identical}/{len(files)}")
+
+    if mismatches:
+        mismatches.sort()
+        print(f"Mean word-level similarity of differing files: {sum(m[0] for m in mismatches) / len(mismatches):.4f}")
+        for similarity, filename, ref_text, cand_text in mismatches[:show_diffs]:
+            print(f"\n  {filename} (similarity {similarity:.4f})")
+            print(f"      {first_difference(ref_text, cand_text)}")
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Diff a fast HTML backend against BeautifulSoup and report throughput.")
+    arg_parser.add_argument("--data-dir", default="baseline_data")
+    arg_parser.add_argument("--reference", default="bs4")
+    arg_parser.add_argument("--candidate", default="lxml")
+    arg_parser.add_argument("--show-diffs", type=int, default=3)
+    args = arg_parser.parse_args()
+    run(args.data_dir, args.reference, args.candidate, args.show_diffs)
@@ -0,0 +1,233 @@
+import os
+import json
+import mmap
+import struct
+import hashlib
+import threading
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows: readers are not kept from opening a store mid-append
+    fcntl = None
+
+MAGIC = b"CHUNKS02"
+# Columns stored as UTF-8 blobs; every other record field goes into "meta" as compact JSON
+COLUMNS = ("id", "source", "text", "meta")
+_ALIGN = 8
+# Appends leave the previous row tables and dropped rows' bytes behind; past this share of the file it is rewritten
+MAX_GARBAGE_RATIO = 0.5
+
+def chunk_key(chunk_id: str) -> int:
+    """Stable non-negative int64 key derived from a (content-addressed) chunk id."""
+    return int.from_bytes(hashlib.sha1(chunk_id.encode('utf-8')).digest()[:8], 'little') & 0x7FFFFFFFFFFFFFFF
+
+def _flock(f, exclusive):
+    # Held until f is closed
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+def _column_values(records):
+    values = {column: [] for column in COLUMNS}
+    keys = []
+    for record in records:
+        extra = {k: v for k, v in record.items() if k not in ("id", "source", "text")}
+        values["id"].append(record["id"].encode('utf-8'))
+        values["source"].append((record.get("source") or "").encode('utf-8'))
+        values["text"].append(record["text"].encode('utf-8'))
+        values["meta"].append(json.dumps(extra, ensure_ascii=False, separators=(',', ':')).encode('utf-8') if extra else b"")
+        keys.append(chunk_key(record["id"]))
+    return np.array(keys, dtype='int64'), values
+
+def _pad(f):
+    f.write(b"\0" * ((-f.tell()) % _ALIGN))
+
+def _write_blobs(f, values):
+    """Appends each column's blobs at the end of f; returns {column: (rows, 2) array of absolute [start, end)}."""
+    spans = {}
+    for column in COLUMNS:
+        _pad(f)
+        ends = f.tell() + np.cumsum([len(v) for v in values[column]], dtype='int64')
+        f.write(b"".join(values[column]))
+        spans[column] = np.stack([ends - [len(v) for v in values[column]], ends], axis=1) if len(ends) else np.zeros((0, 2), dtype='int64')
+    return spans
+
+def _write_tables(f, keys, spans, garbage):
+    """Appends the row tables and the header, which ends the file, to f."""
+    key_order = np.argsort(keys, kind='stable')
+    sections = {}
+    tables = [("keys", keys[key_order]), ("key_rows", key_order.astype('int64'))]
+    tables += [(f"{column}.spans", spans[column].astype('int64')) for column in COLUMNS]
+    for name, data in tables:
+        _pad(f)
+        sections[name] = [f.tell(), data.nbytes]
+        f.write(data.tobytes())
+    header = json.dumps({"rows": len(keys), "garbage": int(garbage), "sections": sections}).encode('utf-8')
+    f.write(header + struct.pack("<Q", len(header)) + MAGIC)
+
+def write_chunk_store(path, records):
+    """
+    Writes records to a single binary file, atomically replacing any previous
+    store. Layout: magic, each column's UTF-8 blobs, then the row tables (chunk
+    keys sorted next to their rows, and per column an array of [start, end)
+    byte spans), and last a JSON header, its length and the magic again. Keeping
+    the header at the end lets update_chunk_store append instead of rewriting.
+    """
+    keys, values = _column_values(records)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        _write_tables(f, keys, _write_blobs(f, values), garbage=0)
+    os.replace(tmp_path, path)
+    return len(keys)
+
+class ChunkStore:
+    """
+    Read-only view of a chunk store file through mmap. Nothing is decoded up
+    front: rows are materialized one at a time, so a search only pays for the
+    records it returns, and processes opening the same file share its pages.
+    Appends made after opening are not seen; open the file again for them.
+    """
+    def __init__(self, path, lock=True):
+        # lock=False when the caller already holds the store's flock
+        self.path = path
+        # mmap keeps its own duplicate of the descriptor it maps, so the lock is taken on a
+        # separate one and released once the header is read
+        with open(path, 'rb') as lock_file:
+            if lock:
+                _flock(lock_file, exclusive=False)
+            with open(path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            size = len(self._mmap)
+            if size < 2 * len(MAGIC) + 8 or self._mmap[:len(MAGIC)] != MAGIC or self._mmap[-len(MAGIC):] != MAGIC:
+                raise ValueError(f"{path} is not a chunk store")
+            (header_length,) = struct.unpack_from("<Q", self._mmap, size - len(MAGIC) - 8)
+            header_start = size - len(MAGIC) - 8 - header_length
+            header = json.loads(bytes(self._mmap[header_start:header_start + header_length]))
+        self._sections = header["sections"]
+        self.rows = header["rows"]
+        self.garbage = header["garbage"]
+
+        self.keys = self._array("keys")
+        self._key_rows = self._array("key_rows")
+        self._spans = {column: self._array(f"{column}.spans").reshape(-1, 2) for column in COLUMNS}
+
+    def _array(self, name):
+        start, length = self._sections[name]
+        return np.frombuffer(self._mmap, dtype='int64', count=length // 8, offset=start)
+
+    def __len__(self):
+        return self.rows
+
+    def value(self, row, column):
+        start, end = self._spans[column][row]
+        return self._mmap[start:end].decode('utf-8')
+
+    def text(self, row):
+        return self.value(row, "text")
+
+    def record(self, row):
+        """The knowledge base record stored at row, as a dict."""
+        record = {"id": self.value(row, "id"), "source": self.value(row, "source"), "text": self.text(row)}
+        meta = self.value(row, "meta")
+        if meta:
+            record.update(json.loads(meta))
+        return record
+
+    def rows_for_keys(self, keys):
+        """Row of each chunk key, or -1 for keys not in the store."""
+        keys = np.asarray(keys, dtype='int64')
+        if self.rows == 0:
+            return np.full(len(keys), -1, dtype='int64')
+        positions = np.minimum(np.searchsorted(self.keys, keys), self.rows - 1)
+        return np.where(self.keys[positions] == keys, self._key_rows[positions], -1)
+
+    def all_keys(self):
+        """Chunk keys in row order."""
+        keys = np.empty(self.rows, dtype='int64')
+        keys[self._key_rows] = self.keys
+        return keys
+
+    def close(self):
+        self.keys = self._key_rows = self._spans = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Arrays handed out by all_keys()/rows_for_keys() are copies, but callers may still hold self.keys
+            pass
+
+def build_chunk_store(knowledge_base_path, store_path):
+    def records():
+        with open(knowledge_base_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+    return write_chunk_store(store_path, records())
+
+def update_chunk_store(store_path, added_records=(), removed_keys=()):
+    """
+    Adds the records whose chunk is not stored yet and drops the rows of
+    removed_keys. Only the new records and the row tables are written, at the
+    end of the file; bytes no longer referenced are reclaimed by rewriting the
+    store once they pass MAX_GARBAGE_RATIO of it. A call with nothing to change
+    writes nothing, so every retriever can apply the same update. Returns the
+    reopened store.
+    """
+    with open(store_path, 'ab') as f:
+        _flock(f, exclusive=True)
+        store = ChunkStore(store_path, lock=False)
+        keys = store.all_keys()
+        live = ~np.isin(keys, np.asarray(list(removed_keys), dtype='int64'))
+        present = set(keys[live].tolist())
+        added = []
+        for record in added_records:
+            key = chunk_key(record["id"])
+            if key not in present:
+                present.add(key)
+                added.append(record)
+        if not added and live.all():
+            return store
+
+        new_keys, values = _column_values(added)
+        size = os.path.getsize(store_path)
+        # Superseded: the old row tables and header (everything after the first table) and the dropped rows
+        garbage = store.garbage + size - store._sections["keys"][0]
+        garbage += sum(int(np.diff(store._spans[column][~live], axis=1).sum()) for column in COLUMNS)
+        if garbage > MAX_GARBAGE_RATIO * (size + sum(len(v) for column in COLUMNS for v in values[column])):
+            records = [store.record(row) for row in np.flatnonzero(live)] + added
+            store.close()
+            write_chunk_store(store_path, records)
+            return ChunkStore(store_path, lock=False)
+
+        spans = {column: np.array(store._spans[column][live]) for column in COLUMNS}
+        keys = keys[live]
+        store.close()
+        new_spans = _write_blobs(f, values)
+        _write_tables(f, np.concatenate([keys, new_keys]),
+                      {column: np.concatenate([spans[column], new_spans[column]]) for column in COLUMNS}, garbage)
+        f.flush()
+        return ChunkStore(store_path, lock=False)
+
+def open_chunk_store(store_path, knowledge_base_path=None, rebuild=False):
+    """
+    Opens the store, first (re)building it from the knowledge base when the
+    store is missing, unreadable (e.g. an older format) or older than
+    knowledge_base_path, or always with rebuild=True (for a knowledge base the
+    caller named explicitly, whatever its mtime).
+    """
+    if rebuild and not (knowledge_base_path and os.path.exists(knowledge_base_path)):
+        raise FileNotFoundError(f"Knowledge base {knowledge_base_path} not found")
+    can_build = bool(knowledge_base_path) and os.path.exists(knowledge_base_path)
+    if can_build and (rebuild or not os.path.exists(store_path)
+                      or os.path.getmtime(store_path) < os.path.getmtime(knowledge_base_path)):
+        print(f"Building chunk store {store_path} from {knowledge_base_path}...")
+        build_chunk_store(knowledge_base_path, store_path)
+    try:
+        return ChunkStore(store_path)
+    except ValueError:
+        if not can_build:
+            raise
+        print(f"Chunk store {store_path} is unreadable; rebuilding it from {knowledge_base_path}...")
+        build_chunk_store(knowledge_base_path, store_path)
+        return ChunkStore(store_path)
@@ -1,48 +1,127 @@
-import nltk
-import ssl
-
-try:
-    _create_unverified_https_context = ssl._create_unverified_context
-except AttributeError:
-    pass
-else:
-    ssl._create_default_https_context = _create_unverified_https_context
-
-nltk.download('punkt', quiet=True)
-nltk.download('punkt_tab', quiet=True)
-
-def chunk_text(text: str, chunk_size: int = 300, overlap: int = 50) -> list[str]:
-    sentences = nltk.tokenize.sent_tokenize(text)
-    chunks = []
-    
+from functools import lru_cache
+from data_pipeline.nltk_resources import require_nltk_resource
+
+def sent_tokenize(text: str) -> list[str]:
+    # nltk takes over a second to import, so it is only loaded once text is actually split
+    require_nltk_resource("punkt_tab")
+    from nltk.tokenize import sent_tokenize as nltk_sent_tokenize
+    return nltk_sent_tokenize(text)
+
+@lru_cache(maxsize=None)
+def load_tokenizer(name: str):
+    """Loads (once per process) the fast HuggingFace tokenizer used to measure chunk lengths."""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(name, use_fast=True)
+
+def _max_chunk_tokens(tokenizer, chunk_size):
+    # Leave room for [CLS]/[SEP] so chunks fit the embedding model's window untruncated
+    limit = tokenizer.model_max_length - tokenizer.num_special_tokens_to_add()
+    return min(chunk_size, limit) if limit > 0 else chunk_size
+
+def _split_long_sentence(sentence, offsets, max_tokens):
+    """Cuts a sentence longer than max_tokens into pieces, preferring word boundaries."""
+    pieces = []
+    piece_start = 0       # index of the first token of the current piece
+    last_word_start = 0   # most recent token that starts a new word within the piece
+    for i in range(1, len(offsets) + 1):
+        if i < len(offsets) and offsets[i][0] > offsets[i - 1][1]:
+            last_word_start = i
+        if i - piece_start == max_tokens or i == len(offsets):
+            cut = i
+            if i < len(offsets) and last_word_start > piece_start and offsets[i][0] == offsets[i - 1][1]:
+                cut = last_word_start
+            text = sentence[offsets[piece_start][0]:offsets[cut - 1][1]].strip()
+            if text:
+                pieces.append((text, cut - piece_start))
+            piece_start = cut
+            last_word_start = cut
+    return pieces
+
+def _measure(sentences, tokenizer, chunk_size):
+    """
+    Returns (sentence, length) pairs, length being whitespace words or, with a
+    tokenizer, model tokens from a single batched call. In token mode sentences
+    longer than a whole chunk are split so no chunk can exceed chunk_size.
+    """
+    if tokenizer is None:
+        return [(s, len(s.split())) for s in sentences]
     if not sentences:
-        return chunks
+        return []
         
+    # verbose=False: over-long sentences are split below, so the "longer than the maximum sequence length" warning is noise
+    encoded = tokenizer(sentences, add_special_tokens=False, verbose=False)
+    measured = []
+    for sentence, ids in zip(sentences, encoded["input_ids"]):
+        if len(ids) <= chunk_size:
+            measured.append((sentence, len(ids)))
+        else:
+            # Offsets are only needed (and only paid for) on the rare over-long sentence
+            offsets = tokenizer(sentence, add_special_tokens=False, return_offsets_mapping=True,
+                                verbose=False)["offset_mapping"]
+            measured.extend(_split_long_sentence(sentence, offsets, chunk_size))
+    return measured
+
+def _chunk_sentences(items, chunk_size, overlap):
+    """
+    Single-pass greedy packing shared by chunk_text and chunk_pages. Takes an
+    iterable of (sentence, length, page) and yields the items of each chunk.
+    Lengths are computed once; the overlap is the longest suffix of the previous
+    chunk that fits in `overlap` and still leaves room for the next sentence.
+    """
     current_chunk = []
     current_length = 0
     
-    for sentence in sentences:
-        sentence_words = len(sentence.split())
+    for item in items:
+        length = item[1]
         
-        if current_length + sentence_words > chunk_size and current_chunk:
-            chunks.append(" ".join(current_chunk))
+        if current_length + length > chunk_size and current_chunk:
+            yield current_chunk
             
-            overlap_words = 0
-            overlap_chunk = []
-            for s in reversed(current_chunk):
-                s_words = len(s.split())
-                if overlap_words + s_words > overlap:
-                    break
-                overlap_chunk.insert(0, s)
-                overlap_words += s_words
+            start = len(current_chunk)
+            overlap_length = 0
+            while start > 0 and overlap_length + current_chunk[start - 1][1] <= overlap:
+                start -= 1
+                overlap_length += current_chunk[start][1]
+            while start < len(current_chunk) and overlap_length + length > chunk_size:
+                overlap_length -= current_chunk[start][1]
+                start += 1
                 
-            current_chunk = overlap_chunk
-            current_length = sum(len(s.split()) for s in current_chunk)
+            current_chunk = current_chunk[start:]
+            current_length = overlap_length
             
-        current_chunk.append(sentence)
-        current_length += sentence_words
+        current_chunk.append(item)
+        current_length += length
         
     if current_chunk:
-        chunks.append(" ".join(current_chunk))
+        yield current_chunk
+
+def chunk_text(text: str, chunk_size: int = 300, overlap: int = 50, tokenizer=None) -> list[str]:
+    """
+    Splits text into sentence-aligned chunks of at most chunk_size units with up
+    to `overlap` units repeated between neighbours. Units are whitespace words,
+    or tokens of `tokenizer` (a fast tokenizer or its HuggingFace name).
+    """
+    if isinstance(tokenizer, str):
+        tokenizer = load_tokenizer(tokenizer)
+    if tokenizer is not None:
+        chunk_size = _max_chunk_tokens(tokenizer, chunk_size)
+        
+    sentences = sent_tokenize(text)
+    items = ((s, length, None) for s, length in _measure(sentences, tokenizer, chunk_size))
+    return [" ".join(item[0] for item in chunk) for chunk in _chunk_sentences(items, chunk_size, overlap)]
+
+def chunk_pages(pages, chunk_size: int = 300, overlap: int = 50, tokenizer=None):
+    """
+    Streaming variant of chunk_text for paged documents. Consumes (page_number, text)
+    pairs lazily, tokenizing one page per batch, and yields (chunk, first_page, last_page).
+    """
+    if isinstance(tokenizer, str):
+        tokenizer = load_tokenizer(tokenizer)
+    if tokenizer is not None:
+        chunk_size = _max_chunk_tokens(tokenizer, chunk_size)
         
-    return chunks
\ No newline at end of file
+    items = ((s, length, page)
+             for page, text in pages
+             for s, length in _measure(sent_tokenize(text), tokenizer, chunk_size))
+    for chunk in _chunk_sentences(items, chunk_size, overlap):
+        yield " ".join(item[0] for item in chunk), chunk[0][2], chunk[-1][2]
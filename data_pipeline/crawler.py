@@ -0,0 +1,90 @@
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HostPool:
+    """
+    Hands out one pooled requests.Session per host and enforces a politeness
+    delay between consecutive requests to the same host. Different hosts never
+    wait on each other.
+    """
+    def __init__(self, host_delay=1.0):
+        self.host_delay = host_delay
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._host_locks = {}
+        self._last_request = {}
+
+    def _host_state(self, host):
+        with self._lock:
+            if host not in self._sessions:
+                session = requests.Session()
+                session.headers.update({'User-Agent': 'Mozilla/5.0'})
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[host] = session
+                self._host_locks[host] = threading.Lock()
+                self._last_request[host] = 0.0
+            return self._sessions[host], self._host_locks[host]
+
+    def run(self, url, fn):
+        """Calls fn(url, session) while holding the host slot for url."""
+        host = urllib.parse.urlparse(url).netloc
+        session, host_lock = self._host_state(host)
+        with host_lock:
+            wait = self._last_request[host] + self.host_delay - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                return fn(url, session)
+            finally:
+                self._last_request[host] = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+def crawl(urls, fetch_fn, max_workers=8, host_delay=1.0):
+    """
+    Runs fetch_fn(url, session) for every url on a bounded thread pool.
+    Requests to the same host are serialized and spaced by host_delay seconds,
+    so total wall time tracks the busiest host rather than the sum of all fetches.
+
+    Returns a dict mapping url -> (result, error); exactly one of them is None.
+    """
+    pool = HostPool(host_delay=host_delay)
+    outcomes = {}
+    total = len(urls)
+    start = time.monotonic()
+
+    def task(url):
+        t0 = time.monotonic()
+        try:
+            return pool.run(url, fetch_fn), None, time.monotonic() - t0
+        except Exception as e:
+            return None, e, time.monotonic() - t0
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(task, url): url for url in urls}
+            for done, future in enumerate(as_completed(futures), start=1):
+                url = futures[future]
+                result, error, elapsed = future.result()
+                outcomes[url] = (result, error)
+                status = "ok" if error is None else f"FAILED ({error})"
+                print(f"[{done}/{total}] {url} {status} in {elapsed:.1f}s")
+    finally:
+        pool.close()
+
+    hosts = len({urllib.parse.urlparse(url).netloc for url in urls})
+    print(f"Crawled {total} URLs across {hosts} hosts in {time.monotonic() - start:.1f}s")
+    return outcomes
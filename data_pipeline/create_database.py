@@ -1,74 +1,367 @@
 import os
 import json
 import glob
-from data_pipeline.parser import parse_html_to_text, parse_pdf_to_text
-from data_pipeline.chunker import chunk_text
+import time
+import hashlib
+import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from data_pipeline.parser import parse_html_to_text, iter_pdf_pages, iter_pdf_pages_parallel, pdf_page_count, HTML_BACKENDS, DEFAULT_HTML_BACKEND
+from data_pipeline.chunker import chunk_text, chunk_pages, load_tokenizer
+from data_pipeline.parallel import ordered_map
+from data_pipeline.dedup import find_near_duplicates
+from data_pipeline.chunk_store import write_chunk_store
 
 BASELINE_DIR = "baseline_data"
 SCRAPED_DIR = "scraped_data"
 OUTPUT_DB = "data/knowledge_base.jsonl"
+# Per-source content hashes, chunking parameters, chunk ids and tombstones
+MANIFEST_PATH = "data/kb_manifest.json"
+# Chunk ids added/removed by the most recent build, for the dense and sparse indexers
+# Chunks dropped as near-duplicates, each pointing at the surviving chunk
+DUPLICATES_PATH = "data/kb_duplicates.jsonl"
+# Binary, memory-mapped copy of the knowledge base shared by the dense and sparse retrievers
+CHUNK_STORE_PATH = "data/chunk_store.bin"
+# Estimated Jaccard similarity of word 5-gram sets above which two chunks are merged
+DEDUP_THRESHOLD = 0.85
 
-def process_file(filepath, ext, db_file):
+# Chunk lengths are measured in tokens of the dense embedding model, so no chunk
+# is silently truncated at encode time
+CHUNK_TOKENIZER = "BAAI/bge-small-en-v1.5"
+CHUNK_SIZE = 200
+CHUNK_OVERLAP = 40
+# Legacy whitespace-word limits, used when chunk_tokenizer is None
+WORD_CHUNK_SIZE = 150
+WORD_CHUNK_OVERLAP = 30
+# PDFs at least this long are streamed page range by page range across the pool
+# instead of being parsed whole by a single worker
+PDF_STREAM_MIN_PAGES = 40
+PDF_PAGES_PER_TASK = 8
+
+def chunk_limits(chunk_tokenizer):
+    if chunk_tokenizer is None:
+        return WORD_CHUNK_SIZE, WORD_CHUNK_OVERLAP
+    return CHUNK_SIZE, CHUNK_OVERLAP
+
+def resolve_chunk_tokenizer(chunk_tokenizer):
+    """
+    Returns chunk_tokenizer if it loads, else None so chunks are measured in
+    whitespace words; an offline machine without the tokenizer cached still
+    builds. Loading it here also caches it before the workers start.
+    """
+    if chunk_tokenizer is None:
+        return None
+    try:
+        load_tokenizer(chunk_tokenizer)
+    except (OSError, ImportError, ValueError) as e:
+        print(f"Chunk tokenizer {chunk_tokenizer} is unavailable ({type(e).__name__}); "
+              f"falling back to {WORD_CHUNK_SIZE}/{WORD_CHUNK_OVERLAP} whitespace-word chunks")
+        return None
+    return chunk_tokenizer
+
+def make_chunk_id(filename, text, seen):
+    """
+    Content-addressed chunk id: stable across runs as long as the chunk text is
+    unchanged, wherever the chunk lands in the document. `seen` counts ids
+    already issued for this file, to disambiguate repeated chunks.
+    """
+    chunk_id = f"{filename}_{hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]}"
+    count = seen.get(chunk_id, 0)
+    seen[chunk_id] = count + 1
+    return chunk_id if count == 0 else f"{chunk_id}_{count}"
+
+def file_sha256(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def iter_pdf_records(filepath, executor=None, window=8, chunk_tokenizer=CHUNK_TOKENIZER):
+    """Yields chunk records for a PDF as its pages are extracted, tagged with page numbers."""
+    filename = os.path.basename(filepath)
+    if executor is None:
+        pages = iter_pdf_pages(filepath)
+    else:
+        pages = iter_pdf_pages_parallel(filepath, executor, pages_per_task=PDF_PAGES_PER_TASK, window=window)
+        
+    chunk_size, overlap = chunk_limits(chunk_tokenizer)
+    chunks = chunk_pages(pages, chunk_size=chunk_size, overlap=overlap, tokenizer=chunk_tokenizer)
+    seen = {}
+    for chunk, first_page, last_page in chunks:
+        yield {
+            "id": make_chunk_id(filename, chunk, seen),
+            "source": filename,
+            "text": chunk,
+            "page_start": first_page,
+            "page_end": last_page
+        }
+
+def process_file(filepath, ext, html_backend=None, chunk_tokenizer=CHUNK_TOKENIZER):
+    """
+    Parses and chunks a single file. Returns (records, seconds, failed) so it can
+    run in a worker process while the parent stays the only writer of the database.
+    """
     filename = os.path.basename(filepath)
-    print(f"Processing: {filename}")
-    chunks_created = 0
+    start = time.perf_counter()
+    records = []
+    failed = False
     try:
         if ext == 'htm':
             with open(filepath, 'r', encoding='utf-8') as f:
                 html_content = f.read()
-            text = parse_html_to_text(html_content)
-        elif ext == 'pdf':
-            text = parse_pdf_to_text(filepath)
-        else:
-            return 0
+            text = parse_html_to_text(html_content, backend=html_backend)
             
-        chunks = chunk_text(text, chunk_size=150, overlap=30)
-        
-        for i, chunk in enumerate(chunks):
-            record = {
-                "id": f"{filename}_chunk_{i}",
-                "source": filename,
-                "text": chunk
-            }
-            db_file.write(json.dumps(record, ensure_ascii=False) + '\n')
-            chunks_created += 1
+            chunk_size, overlap = chunk_limits(chunk_tokenizer)
+            chunks = chunk_text(text, chunk_size=chunk_size, overlap=overlap, tokenizer=chunk_tokenizer)
+            seen = {}
+            for chunk in chunks:
+                records.append({
+                    "id": make_chunk_id(filename, chunk, seen),
+                    "source": filename,
+                    "text": chunk
+                })
+        elif ext == 'pdf':
+            records = list(iter_pdf_records(filepath, chunk_tokenizer=chunk_tokenizer))
             
     except Exception as e:
         print(f"Error processing {filename}: {e}")
+        failed = True
         
-    return chunks_created
+    return records, time.perf_counter() - start, failed
     
 
-def process_all_data():
+def collect_files(search_dirs):
+    files = []
+    for directory in search_dirs:
+        if not os.path.exists(directory):
+            continue
+            
+        html_files = glob.glob(os.path.join(directory, "*.htm")) + glob.glob(os.path.join(directory, "*.html"))
+        files.extend((filepath, 'htm') for filepath in sorted(html_files))
+        
+        pdf_files = glob.glob(os.path.join(directory, "*.pdf"))
+        files.extend((filepath, 'pdf') for filepath in sorted(pdf_files))
+    return files
+
+def is_long_pdf(filepath, ext):
+    if ext != 'pdf':
+        return False
+    try:
+        return pdf_page_count(filepath) >= PDF_STREAM_MIN_PAGES
+    except Exception:
+        return False
+
+def load_manifest():
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {"chunking": None, "files": {}, "tombstones": {}}
+
+def iter_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+def load_existing_records():
+    """
+    Returns ({chunk_id: record}, ids in the knowledge base). Records dropped as
+    near-duplicates are loaded too, so their files can be reused unchanged.
+    """
+    records = {}
+    kb_ids = set()
+    for path in (OUTPUT_DB, DUPLICATES_PATH):
+        if not os.path.exists(path):
+            continue
+        for record in iter_jsonl(path):
+            record.pop("sources", None)
+            record.pop("duplicate_of", None)
+            records[record["id"]] = record
+            if path == OUTPUT_DB:
+                kb_ids.add(record["id"])
+    return records, kb_ids
+
+def deduplicate(in_path, out_path, duplicates_path, threshold=DEDUP_THRESHOLD):
+    """
+    Drops near-duplicate chunks (MinHash/LSH) from in_path. The earliest chunk of
+    each cluster survives in out_path with a "sources" list of every file the
+    cluster came from; the others go to duplicates_path. Returns the dropped ids.
+    """
+    sources = []
+    def texts():
+        for record in iter_jsonl(in_path):
+            sources.append(record["source"])
+            yield record["text"]
+    duplicate_of = find_near_duplicates(texts(), threshold=threshold)
+    
+    cluster_sources = {}
+    for dup, survivor in duplicate_of.items():
+        cluster_sources.setdefault(survivor, [sources[survivor]]).append(sources[dup])
+        
+    ids = []
+    dropped = set()
+    with open(out_path, 'w', encoding='utf-8') as out_file, open(duplicates_path, 'w', encoding='utf-8') as dup_file:
+        for i, record in enumerate(iter_jsonl(in_path)):
+            ids.append(record["id"])
+            if i in duplicate_of:
+                record["duplicate_of"] = ids[duplicate_of[i]]
+                dup_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                dropped.add(record["id"])
+            else:
+                record["sources"] = list(dict.fromkeys(cluster_sources.get(i, [record["source"]])))
+                out_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                
+    print(f"Near-duplicate removal: dropped {len(dropped)} of {len(ids)} chunks "
+          f"({100 * len(dropped) / max(len(ids), 1):.1f}% smaller index), "
+          f"{len(cluster_sources)} surviving chunks merged from duplicates.")
+    return dropped
+
+def write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def process_all_data(workers=None, html_backend=None, chunk_tokenizer=CHUNK_TOKENIZER, incremental=True, dedup=True):
+    """
+    Builds the knowledge base from every baseline and scraped document.
+
+    With incremental=True only files whose content hash (or the chunking
+    parameters) changed since the last build are re-parsed; the others keep
+    their records from the previous knowledge base. Removed files are
+    tombstoned in the manifest. Returns the added and removed chunk ids; the
+    indexers find the same changes themselves by diffing the chunk store.
+
+    With dedup=True near-duplicate chunks (repeated pages, shared Wikipedia
+    boilerplate) are dropped after chunking; see deduplicate().
+
+    workers > 1 parses files in a process pool; results are written in file
+    order, so the output is identical to a serial run. Long PDFs are streamed
+    straight to the database page range by page range.
+    """
     os.makedirs(os.path.dirname(OUTPUT_DB), exist_ok=True)
+    workers = workers or os.cpu_count() or 1
     
-    total_files = 0
-    total_chunks = 0
+    # The manifest records the tokenizer actually used, so a later run that has it re-chunks everything
+    chunk_tokenizer = resolve_chunk_tokenizer(chunk_tokenizer)
+    chunk_size, overlap = chunk_limits(chunk_tokenizer)
+    chunking = {
+        "tokenizer": chunk_tokenizer,
+        "chunk_size": chunk_size,
+        "overlap": overlap,
+        "html_backend": html_backend or DEFAULT_HTML_BACKEND,
+    }
+    manifest = load_manifest()
+    old_records, old_ids = load_existing_records()
+    full_rebuild = not incremental or manifest.get("chunking") != chunking or not old_records
     
     # We will search both directories
-    search_dirs = [BASELINE_DIR, SCRAPED_DIR]
+    files = []
+    for filepath, ext in collect_files([BASELINE_DIR, SCRAPED_DIR]):
+        digest = file_sha256(filepath)
+        entry = manifest["files"].get(filepath)
+        # Files that failed to parse last time are retried even if their bytes are unchanged
+        reused = (not full_rebuild and entry is not None and entry["sha256"] == digest and not entry.get("failed")
+                  and all(chunk_id in old_records for chunk_id in entry["chunk_ids"]))
+        streamed = not reused and is_long_pdf(filepath, ext)
+        files.append((filepath, ext, digest, reused, streamed))
+    worker_fn = partial(process_file, html_backend=html_backend, chunk_tokenizer=chunk_tokenizer)
+    
+    total_chunks = 0
+    timings = []
+    new_files = {}
+    start = time.perf_counter()
+    parse_count = sum(1 for _, _, _, reused, _ in files if not reused)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 and parse_count > 1 else None
     
-    with open(OUTPUT_DB, 'w', encoding='utf-8') as db_file:
-        for directory in search_dirs:
-            if not os.path.exists(directory):
-                continue
+    try:
+        with open(OUTPUT_DB + ".tmp", 'w', encoding='utf-8') as db_file:
+            file_results = ordered_map(executor, worker_fn,
+                                       [(filepath, ext) for filepath, ext, _, reused, streamed in files
+                                        if not reused and not streamed],
+                                       window=workers * 2)
+            
+            for filepath, ext, digest, reused, streamed in files:
+                filename = os.path.basename(filepath)
+                file_start = time.perf_counter()
+                chunk_ids = []
+                failed = False
                 
-            html_files = glob.glob(os.path.join(directory, "*.htm")) + glob.glob(os.path.join(directory, "*.html"))
-            for filepath in html_files:
-                chunks_added = process_file(filepath, 'htm', db_file)
-                total_chunks += chunks_added
-                total_files += 1
+                if reused:
+                    for chunk_id in manifest["files"][filepath]["chunk_ids"]:
+                        db_file.write(json.dumps(old_records[chunk_id], ensure_ascii=False) + '\n')
+                        chunk_ids.append(chunk_id)
+                elif streamed:
+                    try:
+                        for record in iter_pdf_records(filepath, executor, window=workers * 2, chunk_tokenizer=chunk_tokenizer):
+                            db_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                            chunk_ids.append(record["id"])
+                    except Exception as e:
+                        print(f"Error processing {filename}: {e}")
+                        failed = True
+                else:
+                    records, elapsed, failed = next(file_results)
+                    for record in records:
+                        db_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                        chunk_ids.append(record["id"])
+                        
+                if not reused:
+                    if streamed:
+                        elapsed = time.perf_counter() - file_start
+                    print(f"Processed: {filename} ({len(chunk_ids)} chunks, {elapsed:.2f}s{', streamed' if streamed else ''})")
+                    timings.append((elapsed, filename))
+                total_chunks += len(chunk_ids)
+                new_files[filepath] = {"sha256": digest, "chunk_ids": chunk_ids}
+                if failed:
+                    new_files[filepath]["failed"] = True
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    
+    tombstones = {} if full_rebuild else manifest.get("tombstones", {})
+    removed_files = [filepath for filepath in manifest["files"] if filepath not in new_files]
+    for filepath in removed_files:
+        tombstones[filepath] = {"removed_at": time.time(), "chunk_ids": manifest["files"][filepath]["chunk_ids"]}
+    for filepath in new_files:
+        tombstones.pop(filepath, None)
+    write_json(MANIFEST_PATH, {"chunking": chunking, "files": new_files, "tombstones": tombstones})
+    
+    new_ids = {chunk_id for entry in new_files.values() for chunk_id in entry["chunk_ids"]}
+    if dedup:
+        new_ids -= deduplicate(OUTPUT_DB + ".tmp", OUTPUT_DB, DUPLICATES_PATH)
+        os.remove(OUTPUT_DB + ".tmp")
+    else:
+        os.replace(OUTPUT_DB + ".tmp", OUTPUT_DB)
+        if os.path.exists(DUPLICATES_PATH):
+            os.remove(DUPLICATES_PATH)
+    write_chunk_store(CHUNK_STORE_PATH, iter_jsonl(OUTPUT_DB))
+    added = sorted(new_ids - old_ids)
+    removed = sorted(old_ids - new_ids)
                 
-            pdf_files = glob.glob(os.path.join(directory, "*.pdf"))
-            for filepath in pdf_files:
-                chunks_added = process_file(filepath, 'pdf', db_file)
-                total_chunks += chunks_added
-                total_files += 1
+    wall_time = time.perf_counter() - start
 
     print("\n--- Database Creation Complete ---")
-    print(f"Processed {total_files} files.")
-    print(f"Generated {total_chunks} total chunks.")
+    print(f"{'Full rebuild' if full_rebuild else 'Incremental build'}: {len(files)} files, "
+          f"{len(timings)} parsed with {workers} worker(s), {len(files) - len(timings)} unchanged, "
+          f"{len(removed_files)} removed.")
+    print(f"Generated {total_chunks} total chunks, {len(new_ids)} kept ({len(added)} added, {len(removed)} removed).")
+    print(f"Wall time: {wall_time:.1f}s, summed per-file time: {sum(t for t, _ in timings):.1f}s")
+    if timings:
+        print("Slowest files:")
+        for elapsed, filename in sorted(timings, reverse=True)[:5]:
+            print(f"  {elapsed:7.2f}s  {filename}")
     print(f"Saved to: {OUTPUT_DB}")
+    return added, removed
 
 if __name__ == "__main__":
-    process_all_data()
+    arg_parser = argparse.ArgumentParser(description="Build data/knowledge_base.jsonl from baseline and scraped documents.")
+    arg_parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count, 1 = serial)")
+    arg_parser.add_argument("--html-backend", choices=sorted(HTML_BACKENDS), default=None, help="HTML text extractor (default: lxml if installed)")
+    arg_parser.add_argument("--chunk-tokenizer", default=CHUNK_TOKENIZER,
+                            help="HuggingFace tokenizer that measures chunk lengths, or 'words' for whitespace words")
+    arg_parser.add_argument("--full", action="store_true", help="Ignore the manifest and re-parse every file")
+    arg_parser.add_argument("--no-dedup", action="store_true", help="Keep near-duplicate chunks")
+    args = arg_parser.parse_args()
+    chunk_tokenizer = None if args.chunk_tokenizer == "words" else args.chunk_tokenizer
+    process_all_data(workers=args.workers, html_backend=args.html_backend, chunk_tokenizer=chunk_tokenizer,
+                     incremental=not args.full, dedup=not args.no_dedup)
@@ -0,0 +1,193 @@
+import os
+import glob
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+class Stage:
+    """
+    One pipeline step. inputs and outputs are glob patterns; a stage is skipped
+    when its outputs exist and the content fingerprint of its inputs matches the
+    last successful run. always_run marks stages whose real inputs live outside
+    the repo (e.g. the scraper, which revalidates remote pages itself).
+    """
+    def __init__(self, name, fn, inputs=(), outputs=(), deps=(), always_run=False):
+        self.name = name
+        self.fn = fn
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+        self.always_run = always_run
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def fingerprint(patterns):
+    """Content hash over every file matched by the glob patterns (sorted, recursive)."""
+    digest = hashlib.sha256()
+    for pattern in patterns:
+        digest.update(pattern.encode('utf-8'))
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            if os.path.isdir(path):
+                files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+            else:
+                files = [path]
+            for file_path in files:
+                digest.update(file_path.encode('utf-8'))
+                digest.update(_file_digest(file_path).encode('ascii'))
+    return digest.hexdigest()
+
+class PipelineRunner:
+    """
+    Runs stages in dependency order, independent stages concurrently, skipping
+    those whose inputs are unchanged. Fingerprints and wall times are kept in
+    state_path between runs.
+    """
+    def __init__(self, stages, state_path="data/pipeline_state.json", max_workers=2):
+        self.stages = {stage.name: stage for stage in stages}
+        self.order = self._topological_order(stages)
+        self.state_path = state_path
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self.state = {}
+        if os.path.exists(state_path):
+            with open(state_path, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+
+    def _topological_order(self, stages):
+        order = []
+        visiting = set()
+        done = set()
+
+        def visit(name, path):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline has a dependency cycle: {' -> '.join(path + [name])}")
+            if name not in self.stages:
+                raise ValueError(f"Stage '{path[-1]}' depends on unknown stage '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep, path + [name])
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for stage in stages:
+            visit(stage.name, [])
+        return order
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        # Held across the write so a concurrent stage cannot overwrite newer state with an older snapshot
+        with self._lock:
+            with open(self.state_path, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, indent=2, sort_keys=True)
+
+    def _outputs_exist(self, stage):
+        return all(glob.glob(pattern) for pattern in stage.outputs)
+
+    def _reason_to_run(self, stage, force, current_fingerprint):
+        if force:
+            return "forced"
+        if stage.always_run:
+            return "always runs"
+        if not self._outputs_exist(stage):
+            return "outputs missing"
+        previous = self.state.get(stage.name, {}).get("fingerprint")
+        if previous is None:
+            return "never run"
+        if previous != current_fingerprint:
+            return "inputs changed"
+        return None
+
+    def plan(self, force=False):
+        """
+        Dry run: (name, action, reason) per stage, action being 'run', 'maybe'
+        or 'skip'. A stage downstream of one that runs is 'maybe', since its
+        inputs are only known once upstream has finished.
+        """
+        will_run = set()
+        plan = []
+        for name in self.order:
+            stage = self.stages[name]
+            reason = self._reason_to_run(stage, force, fingerprint(stage.inputs))
+            if reason is not None:
+                action = "run"
+            elif any(dep in will_run for dep in stage.deps):
+                action, reason = "maybe", "upstream stage runs first"
+            else:
+                action, reason = "skip", "inputs unchanged"
+            if action != "skip":
+                will_run.add(name)
+            plan.append((name, action, reason))
+        return plan
+
+    def _run_stage(self, stage, force):
+        current_fingerprint = fingerprint(stage.inputs)
+        reason = self._reason_to_run(stage, force, current_fingerprint)
+        if reason is None:
+            print(f"[pipeline] {stage.name}: skipped (inputs unchanged)")
+            return "skipped", 0.0
+
+        print(f"[pipeline] {stage.name}: running ({reason})")
+        start = time.perf_counter()
+        stage.fn()
+        wall_time = time.perf_counter() - start
+
+        with self._lock:
+            self.state[stage.name] = {
+                "fingerprint": current_fingerprint,
+                "wall_time": wall_time,
+                "finished_at": time.time(),
+            }
+        self._save_state()
+        print(f"[pipeline] {stage.name}: finished in {wall_time:.1f}s")
+        return "ran", wall_time
+
+    def run(self, dry_run=False, force=False):
+        if dry_run:
+            print("--- Pipeline Dry Run ---")
+            for name, action, reason in self.plan(force=force):
+                print(f"  {name:<16} {action.upper():<6} ({reason})")
+            return {}
+
+        results = {}
+        pending = list(self.order)
+        futures = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or futures:
+                for name in list(pending):
+                    deps = [results.get(dep, (None,))[0] for dep in self.stages[name].deps]
+                    if any(status in ("failed", "blocked") for status in deps):
+                        results[name] = ("blocked", 0.0)
+                        pending.remove(name)
+                    elif all(status in ("ran", "skipped") for status in deps):
+                        futures[executor.submit(self._run_stage, self.stages[name], force)] = name
+                        pending.remove(name)
+
+                if not futures:
+                    break
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = futures.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        print(f"[pipeline] {name}: FAILED ({e})")
+                        results[name] = ("failed", 0.0)
+
+        print("\n--- Pipeline Summary ---")
+        for name in self.order:
+            status, wall_time = results.get(name, ("blocked", 0.0))
+            print(f"  {name:<16} {status:<8} {wall_time:8.1f}s")
+        failed = [name for name in self.order if results.get(name, ("blocked",))[0] == "failed"]
+        if failed:
+            raise RuntimeError(f"Pipeline stages failed: {', '.join(failed)}")
+        return results
@@ -0,0 +1,71 @@
+import re
+import zlib
+import numpy as np
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WORD_RE = re.compile(r"\w+")
+
+class MinHasher:
+    """
+    MinHash signatures over word shingles. Two signatures agree in each position
+    with probability equal to the Jaccard similarity of the shingle sets.
+    """
+    def __init__(self, num_perm=128, shingle_size=5, seed=1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # a, b < 2^32 and shingle hashes < 2^32, so a * h + b never overflows uint64
+        self.a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text):
+        words = _WORD_RE.findall(text.lower())
+        if len(words) <= self.shingle_size:
+            return {" ".join(words)} if words else set()
+        return {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def signature(self, text):
+        shingles = self.shingles(text)
+        if not shingles:
+            return None
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+        permuted = (np.outer(hashes, self.a) + self.b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+def find_near_duplicates(texts, threshold=0.85, num_perm=128, bands=16, shingle_size=5):
+    """
+    LSH over MinHash signatures. Candidates share at least one band of
+    num_perm / bands rows; they are confirmed when the estimated Jaccard
+    similarity reaches `threshold`.
+
+    Returns {duplicate_index: survivor_index}, where the survivor is always the
+    earliest text of its cluster, so the result is deterministic in input order.
+    """
+    rows = num_perm // bands
+    hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+    buckets = [{} for _ in range(bands)]
+    signatures = []
+    duplicate_of = {}
+
+    for i, text in enumerate(texts):
+        signature = hasher.signature(text)
+        signatures.append(signature)
+        if signature is None:
+            continue
+
+        candidates = set()
+        keys = [signature[band * rows:(band + 1) * rows].tobytes() for band in range(bands)]
+        for band, key in enumerate(keys):
+            candidates.update(buckets[band].get(key, ()))
+
+        for j in sorted(candidates):
+            if np.mean(signatures[j] == signature) >= threshold:
+                duplicate_of[i] = j
+                break
+        else:
+            # Only survivors are bucketed, so every cluster is keyed by its earliest member
+            for band, key in enumerate(keys):
+                buckets[band].setdefault(key, []).append(i)
+
+    return duplicate_of
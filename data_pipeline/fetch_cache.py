@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import urllib.parse
+
+
+class FetchMetadataStore:
+    """
+    Per-URL fetch metadata (ETag, Last-Modified, content hash, fetch time) kept
+    next to the scraped files, so refreshes can send conditional requests and
+    report exactly which documents changed.
+
+    max_age_policy maps a full URL or a domain to a max age in seconds. A cached
+    copy younger than its max age is not revalidated at all.
+    """
+    def __init__(self, path="scraped_data/fetch_metadata.json", max_age_policy=None, default_max_age=7 * 24 * 3600):
+        self.path = path
+        self.max_age_policy = max_age_policy or {}
+        self.default_max_age = default_max_age
+        self.entries = {}
+        self.last_run = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.entries = data.get("urls", {})
+            self.last_run = data.get("last_run", {})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock:
+            data = {"urls": self.entries, "last_run": self.last_run}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def max_age_for(self, url):
+        if url in self.max_age_policy:
+            return self.max_age_policy[url]
+        host = urllib.parse.urlparse(url).hostname or ""
+        # Most specific domain wins: www.cmu.edu, then cmu.edu, then edu
+        parts = host.split('.')
+        for i in range(len(parts)):
+            domain = '.'.join(parts[i:])
+            if domain in self.max_age_policy:
+                return self.max_age_policy[domain]
+        return self.default_max_age
+
+    def seed_from_disk(self, url, filepath):
+        """Adopts a file downloaded before metadata existed, dated by its mtime."""
+        with self._lock:
+            if url in self.entries or not os.path.exists(filepath):
+                return
+            with open(filepath, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            self.entries[url] = {
+                "filename": os.path.basename(filepath),
+                "etag": None,
+                "last_modified": None,
+                "sha256": digest,
+                "fetched_at": os.path.getmtime(filepath),
+                "checked_at": os.path.getmtime(filepath),
+            }
+
+    def is_fresh(self, url, filepath, now=None):
+        entry = self.entries.get(url)
+        if entry is None or not os.path.exists(filepath):
+            return False
+        now = time.time() if now is None else now
+        return now - entry["checked_at"] < self.max_age_for(url)
+
+    def conditional_headers(self, url, filepath):
+        entry = self.entries.get(url)
+        if entry is None or not os.path.exists(filepath):
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def mark_not_modified(self, url):
+        with self._lock:
+            self.entries[url]["checked_at"] = time.time()
+
+    def record(self, url, filepath, response_headers, digest: str):
+        """
+        Stores metadata for a full (200) response, given the sha256 hex digest of
+        its body, and returns 'new', 'changed' or 'unchanged' by comparing it
+        with the previous fetch.
+        """
+        now = time.time()
+        with self._lock:
+            previous = self.entries.get(url)
+            if previous is None or not os.path.exists(filepath):
+                status = "new"
+            elif previous["sha256"] != digest:
+                status = "changed"
+            else:
+                status = "unchanged"
+            self.entries[url] = {
+                "filename": os.path.basename(filepath),
+                "etag": response_headers.get("ETag"),
+                "last_modified": response_headers.get("Last-Modified"),
+                "sha256": digest,
+                "fetched_at": now if status != "unchanged" else previous["fetched_at"],
+                "checked_at": now,
+            }
+        return status
+
+    def set_last_run(self, statuses):
+        """statuses maps filename -> new/changed/unchanged/fresh/failed."""
+        summary = {"finished_at": time.time()}
+        for filename, status in sorted(statuses.items()):
+            summary.setdefault(status, []).append(filename)
+        with self._lock:
+            self.last_run = summary
@@ -0,0 +1,33 @@
+import sys
+from functools import lru_cache
+
+# NLTK data packages used by the chunker (sentence splitting) and the BM25 retriever (stopwords)
+NLTK_PACKAGES = ("punkt", "punkt_tab", "stopwords")
+_RESOURCE_PATHS = {
+    "punkt": "tokenizers/punkt",
+    "punkt_tab": "tokenizers/punkt_tab/english/",
+    "stopwords": "corpora/stopwords",
+}
+
+@lru_cache(maxsize=None)
+def require_nltk_resource(package):
+    """
+    Checks that an NLTK data package is installed locally, without touching the
+    network. Raises LookupError with the one-off install command if it is not.
+    """
+    import nltk
+    try:
+        nltk.data.find(_RESOURCE_PATHS[package])
+    except LookupError:
+        raise LookupError(f"NLTK resource '{package}' is not installed. Resources are never downloaded at run time; "
+                          f"install them once with: python -m data_pipeline.nltk_resources") from None
+
+def download_nltk_resources(packages=NLTK_PACKAGES):
+    import nltk
+    for package in packages:
+        if not nltk.download(package, quiet=True):
+            sys.exit(f"Failed to download NLTK resource '{package}'")
+        print(f"NLTK resource '{package}' installed")
+
+if __name__ == "__main__":
+    download_nltk_resources()
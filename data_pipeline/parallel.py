@@ -0,0 +1,26 @@
+from collections import deque
+
+def ordered_map(executor, fn, args_list, window=8):
+    """
+    Yields fn(*args) for each args tuple in input order, keeping at most `window`
+    tasks in flight so results never pile up in memory. Runs serially in the
+    calling process when executor is None.
+    """
+    if executor is None:
+        for args in args_list:
+            yield fn(*args)
+        return
+
+    pending = deque()
+    args_iter = iter(args_list)
+    for args in args_iter:
+        pending.append(executor.submit(fn, *args))
+        if len(pending) >= window:
+            break
+
+    while pending:
+        result = pending.popleft().result()
+        next_args = next(args_iter, None)
+        if next_args is not None:
+            pending.append(executor.submit(fn, *next_args))
+        yield result
@@ -1,29 +1,79 @@
 import sys
 import os
+import argparse
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from data_pipeline.scrape_websites import main as scrape_main
-from data_pipeline.create_database import process_all_data
-from RAG.document_query_embedder import DenseRetriever
-from RAG.sparse_embedder import SparseRetriever
+from data_pipeline.dag import Stage, PipelineRunner
 
-def run_pipeline():
-    print("STEP 1: Scraping Websites")
+SOURCE_PATTERNS = [f"{directory}/*.{ext}" for directory in ("baseline_data", "scraped_data") for ext in ("htm", "html", "pdf")]
+KNOWLEDGE_BASE = "data/knowledge_base.jsonl"
+
+def scrape():
+    from data_pipeline.scrape_websites import main as scrape_main
+    # create_database finds the changed files itself from their content hashes
     scrape_main()
-    
-    print("STEP 2: Creating Database (from baseline & scraped data)")
+
+def create_database():
+    from data_pipeline.create_database import process_all_data
     process_all_data()
 
-    print("STEP 3: Building Dense Retrieval Index (FAISS)")
+def build_dense():
+    from RAG.document_query_embedder import DenseRetriever
     dense = DenseRetriever()
-    dense.build_index()
+    # An existing index is patched in place, so only new or edited chunks are embedded
+    if dense.load_index():
+        dense.update_from_knowledge_base()
+    else:
+        dense.build_index()
+
+def build_sparse():
+    from RAG.sparse_embedder import SparseRetriever
+    # Like the dense index: new chunks go into a delta segment and removed ones are marked deleted
+    sparse = SparseRetriever(background_merge=False)
+    if sparse.load_index():
+        sparse.update_from_knowledge_base()
+    else:
+        sparse.build_index()
+
+def build_stages(skip_scrape=False):
+    stages = [
+        Stage("create_database", create_database,
+              inputs=SOURCE_PATTERNS + ["data_pipeline/create_database.py", "data_pipeline/parser.py",
+                                        "data_pipeline/chunker.py", "data_pipeline/dedup.py",
+                                        "data_pipeline/parallel.py", "data_pipeline/chunk_store.py",
+                                        "data_pipeline/nltk_resources.py"],
+              outputs=[KNOWLEDGE_BASE, "data/chunk_store.bin"],
+              deps=[] if skip_scrape else ["scrape"]),
+        # The dense and sparse builds only depend on the knowledge base, so they run side by side
+        Stage("dense_index", build_dense,
+              inputs=[KNOWLEDGE_BASE, "RAG/document_query_embedder.py", "RAG/index_factory.py",
+                      "RAG/embedding_cache.py", "RAG/inference_backends.py", "RAG/rescoring.py",
+                      "RAG/lru_cache.py", "data_pipeline/chunk_store.py"],
+              outputs=["data/faiss_index.bin"],
+              deps=["create_database"]),
+        Stage("sparse_index", build_sparse,
+              inputs=[KNOWLEDGE_BASE, "RAG/sparse_embedder.py", "RAG/bm25_segments.py",
+                      "data_pipeline/chunk_store.py", "data_pipeline/nltk_resources.py"],
+              outputs=["data/bm25_index"],
+              deps=["create_database"]),
+    ]
+    if not skip_scrape:
+        # Remote pages are the real input; the scraper's own fetch cache decides what to refetch
+        stages.insert(0, Stage("scrape", scrape, inputs=["data_pipeline/scrape_websites.py"],
+                               outputs=["scraped_data"], always_run=True))
+    return stages
 
-    print("STEP 4: Building Sparse Retrieval Index (BM25)")
-    sparse = SparseRetriever()
-    sparse.build_index()
-    
-    print("DATA PIPELINE COMPLETED SUCCESSFULLY!")
+def run_pipeline(dry_run=False, force=False, skip_scrape=False):
+    runner = PipelineRunner(build_stages(skip_scrape=skip_scrape))
+    runner.run(dry_run=dry_run, force=force)
+    if not dry_run:
+        print("DATA PIPELINE COMPLETED SUCCESSFULLY!")
 
 if __name__ == "__main__":
-    run_pipeline()
+    arg_parser = argparse.ArgumentParser(description="Scrape, chunk and index the RAG corpus, skipping up-to-date stages.")
+    arg_parser.add_argument("--dry-run", action="store_true", help="Show which stages would run and why")
+    arg_parser.add_argument("--force", action="store_true", help="Run every stage regardless of fingerprints")
+    arg_parser.add_argument("--skip-scrape", action="store_true", help="Build from the files already in scraped_data/")
+    args = arg_parser.parse_args()
+    run_pipeline(dry_run=args.dry_run, force=args.force, skip_scrape=args.skip_scrape)
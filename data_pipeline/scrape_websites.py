@@ -1,9 +1,22 @@
 import os
-import time
 import urllib.parse
-from data_pipeline.scraper import fetch_html, download_pdf
+import hashlib
+from data_pipeline.scraper import fetch_document, download_pdf
+from data_pipeline.crawler import crawl
+from data_pipeline.fetch_cache import FetchMetadataStore
 
 SCRAPED_DIR = "scraped_data"
+FETCH_METADATA = os.path.join(SCRAPED_DIR, "fetch_metadata.json")
+
+DAY = 24 * 3600
+DEFAULT_MAX_AGE = 7 * DAY
+# Reference pages rarely change; event calendars and schedules go stale within a day
+MAX_AGE_POLICY = {
+    "wikipedia.org": 30 * DAY,
+    "britannica.com": 30 * DAY,
+}
+VOLATILE_URL_KEYWORDS = ("event", "calendar", "schedule")
+VOLATILE_MAX_AGE = DAY
 
 def get_safe_filename(url):
     parsed = urllib.parse.urlparse(url)
@@ -17,7 +30,38 @@ def get_safe_filename(url):
     else:
         return safe_name + ".htm"
 
-def main():
+def normalize_url(url):
+    """Canonical form used to drop repeated entries (fragments, trailing slashes) from the URL list."""
+    parsed = urllib.parse.urlparse(url)
+    path = parsed.path.rstrip('/')
+    return urllib.parse.urlunparse((parsed.scheme, parsed.netloc.lower(), path, parsed.params, parsed.query, ''))
+
+def scrape_url(url, filepath, store, session=None):
+    is_pdf = url.endswith('.pdf')
+    response = fetch_document(url, session=session, headers=store.conditional_headers(url, filepath), stream=is_pdf)
+    if response.status_code == 304:
+        store.mark_not_modified(url)
+        return "unchanged"
+    
+    if is_pdf:
+        # PDFs are streamed to disk rather than held in memory whole
+        part_path, digest = download_pdf(response, filepath)
+        status = store.record(url, filepath, response.headers, digest)
+        if status != "unchanged":
+            os.replace(part_path, filepath)
+        else:
+            os.remove(part_path)
+        return status
+    
+    # Save raw HTML
+    content = response.text.encode('utf-8')
+    status = store.record(url, filepath, response.headers, hashlib.sha256(content).hexdigest())
+    if status != "unchanged":
+        with open(filepath, 'wb') as f:
+            f.write(content)
+    return status
+
+def main(max_workers=8, host_delay=1.0):
     urls = [
         # CMU People & Culture
         "https://en.wikipedia.org/wiki/Andy_Warhol",
@@ -350,35 +394,59 @@ def main():
         "https://www.warhol.org/the-pop-district/",
 ]
 
+    unique_urls = {}
+    for url in urls:
+        unique_urls.setdefault(normalize_url(url), url)
+    if len(unique_urls) < len(urls):
+        print(f"Dropped {len(urls) - len(unique_urls)} repeated URLs from the list.")
+    urls = list(unique_urls.values())
+    
     print(f"Beginning scraping/caching for {len(urls)} URLs...")
     os.makedirs(SCRAPED_DIR, exist_ok=True)
-    added_files = 0
     
+    max_age_policy = dict(MAX_AGE_POLICY)
+    for url in urls:
+        if any(keyword in url.lower() for keyword in VOLATILE_URL_KEYWORDS):
+            max_age_policy[url] = VOLATILE_MAX_AGE
+    store = FetchMetadataStore(FETCH_METADATA, max_age_policy=max_age_policy, default_max_age=DEFAULT_MAX_AGE)
+    
+    statuses = {}
+    pending = {}
     for url in urls:
         filename = get_safe_filename(url)
         filepath = os.path.join(SCRAPED_DIR, filename)
         
-        if os.path.exists(filepath):
-            print(f"Skipping {url} (already downloaded)")
+        store.seed_from_disk(url, filepath)
+        if store.is_fresh(url, filepath):
+            print(f"Skipping {url} (cached copy is fresh)")
+            statuses[filename] = "fresh"
             continue
-            
-        print(f"Downloading: {url} -> {filename}")
-        try:
-            if url.endswith('.pdf'):
-                download_pdf(url, filepath)
-            else:
-                html = fetch_html(url)
-                # Save raw HTML
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    f.write(html)
-            
-            added_files += 1
-            time.sleep(1.0) # Polite crawling
-        except Exception as e:
-            print(f"Failed to scrape {url}: {e}")
+        pending[url] = filepath
+    
+    print(f"Fetching {len(pending)} URLs with {max_workers} workers ({host_delay}s delay per host)...")
+    outcomes = crawl(list(pending), lambda url, session: scrape_url(url, pending[url], store, session),
+                     max_workers=max_workers, host_delay=host_delay)
+    
+    for url, (status, error) in outcomes.items():
+        filename = os.path.basename(pending[url])
+        if error is None:
+            statuses[filename] = status
+        else:
+            statuses[filename] = "failed"
+            print(f"Failed to scrape {url}: {error}")
+    
+    store.set_last_run(statuses)
+    store.save()
+    
+    counts = {}
+    for status in statuses.values():
+        counts[status] = counts.get(status, 0) + 1
             
     print(f"\n--- Scraping Complete ---")
-    print(f"Successfully downloaded {added_files} new files to {SCRAPED_DIR}.")
+    print(f"New: {counts.get('new', 0)}, changed: {counts.get('changed', 0)}, "
+          f"not modified: {counts.get('unchanged', 0)}, still fresh: {counts.get('fresh', 0)}, "
+          f"failed: {counts.get('failed', 0)}")
+    print(f"Fetch metadata saved to {FETCH_METADATA}.")
 
 if __name__ == "__main__":
     main()
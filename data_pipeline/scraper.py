@@ -1,22 +1,35 @@
 import requests
 import os
+import hashlib
 
-def fetch_html(url: str) -> str:
-    headers = {'User-Agent': 'Mozilla/5.0'}
-    response = requests.get(url, headers=headers, timeout=10)
-    response.raise_for_status()
-    return response.text
+def fetch_html(url: str, session=None) -> str:
+    return fetch_document(url, session=session).text
 
-def download_pdf(url: str, save_path: str):
-    headers = {'User-Agent': 'Mozilla/5.0'}
-    response = requests.get(url, headers=headers, stream=True, timeout=10)
-    response.raise_for_status()
-    
-    os.makedirs(os.path.dirname(save_path), exist_ok=True)
-    with open(save_path, 'wb') as f:
+def download_pdf(response, save_path: str):
+    """
+    Streams a response body to save_path + ".part" in 8 KB chunks and returns
+    (part_path, sha256 hex digest); the caller decides whether to keep it.
+    """
+    os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+    part_path = save_path + ".part"
+    digest = hashlib.sha256()
+    with open(part_path, 'wb') as f:
         for chunk in response.iter_content(chunk_size=8192):
             f.write(chunk)
-    return save_path
+            digest.update(chunk)
+    return part_path, digest.hexdigest()
+
+def fetch_document(url: str, session=None, headers=None, stream=False):
+    """
+    GET with optional conditional headers. A 304 Not Modified response is
+    returned as-is instead of raising, so callers can keep their cached copy.
+    """
+    request_headers = {'User-Agent': 'Mozilla/5.0'}
+    request_headers.update(headers or {})
+    response = (session or requests).get(url, headers=request_headers, stream=stream, timeout=10)
+    if response.status_code != 304:
+        response.raise_for_status()
+    return response
 
 if __name__ == "__main__":
     pass
@@ -1,23 +1,96 @@
+import os
 import json
-import urllib.request
+import time
+import threading
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from bs4 import BeautifulSoup
-import time
-import re
+from data_pipeline.crawler import HostPool
 
 input_file = "verified_urls.json"
 output_file = "final_urls_to_scrape.json"
+cache_file = os.path.join("data", "url_verification_cache.json")
+
+# Default endpoints; main() and repair_url() take overrides, e.g. a local stub server
+WIKIPEDIA_API = "https://en.wikipedia.org/w/api.php"
+WIKIPEDIA_ARTICLE = "https://en.wikipedia.org/wiki/"
+SEARCH_URL = "https://html.duckduckgo.com/html/"
+
+GOOD_URL_TTL = 7 * 24 * 3600
+BAD_URL_TTL = 24 * 3600
+
+class UrlVerifier:
+    """
+    Checks URLs with HEAD, falling back to a one-byte ranged GET for servers that
+    reject HEAD. Requests share per-host pooled sessions and politeness delays,
+    and results persist in cache_path so known-good and known-bad URLs are not
+    re-checked until their TTL expires.
+    """
+    def __init__(self, pool, cache_path=cache_file, good_ttl=GOOD_URL_TTL, bad_ttl=BAD_URL_TTL):
+        self.pool = pool
+        self.cache_path = cache_path
+        self.good_ttl = good_ttl
+        self.bad_ttl = bad_ttl
+        self.hits = 0
+        self.checks = 0
+        self._lock = threading.Lock()
+        self.cache = {}
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                self.cache = json.load(f)
+
+    def save(self):
+        if not self.cache_path:
+            return
+        with self._lock:
+            data = dict(self.cache)
+        directory = os.path.dirname(self.cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write-then-rename so an interrupted run never leaves a truncated cache
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.cache_path)
+
+    def _check(self, url, session):
+        response = session.head(url, timeout=3, allow_redirects=True)
+        if response.status_code == 200:
+            return True
+        if response.status_code in (403, 405, 501) or response.status_code >= 500:
+            # Some servers refuse or mishandle HEAD; ask for a single byte instead
+            response = session.get(url, headers={'Range': 'bytes=0-0'}, timeout=3, stream=True)
+            response.close()
+            return response.status_code in (200, 206)
+        return False
 
-def fetch_search_results(query):
+    def verify(self, url):
+        now = time.time()
+        with self._lock:
+            entry = self.cache.get(url)
+        if entry is not None:
+            ttl = self.good_ttl if entry["ok"] else self.bad_ttl
+            if now - entry["checked_at"] < ttl:
+                with self._lock:
+                    self.hits += 1
+                return entry["ok"]
+
+        try:
+            ok = self.pool.run(url, self._check)
+        except Exception:
+            ok = False
+        with self._lock:
+            self.checks += 1
+            self.cache[url] = {"ok": ok, "checked_at": time.time()}
+        return ok
+
+def fetch_search_results(query, pool, search_url=SEARCH_URL):
     try:
-        url = "https://html.duckduckgo.com/html/?q=" + urllib.parse.quote(query + " site:wikipedia.org OR site:pittsburghpa.gov OR site:cmu.edu")
-        req = urllib.request.Request(
-            url, 
-            headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        )
-        html = urllib.request.urlopen(req, timeout=5).read()
+        url = search_url + "?q=" + urllib.parse.quote(query + " site:wikipedia.org OR site:pittsburghpa.gov OR site:cmu.edu")
+        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+        html = pool.run(url, lambda u, session: session.get(u, headers=headers, timeout=5).content)
         soup = BeautifulSoup(html, 'html.parser')
-        
+
         for a in soup.find_all('a', class_='result__url'):
             href = a.get('href', '')
             if href.startswith('//duckduckgo.com/l/?uddg='):
@@ -27,30 +100,40 @@ def fetch_search_results(query):
         pass
     return None
 
-def verify_url(url):
-    try:
-        req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-        return urllib.request.urlopen(req, timeout=3).getcode() == 200
-    except Exception:
-        return False
-
-def search_wikipedia(query):
+def search_wikipedia(query, pool, api_url=WIKIPEDIA_API, article_url=WIKIPEDIA_ARTICLE):
     try:
         keywords = " ".join([w for w in query.replace("?", "").replace("/", " ").replace("-", " ").split() if len(w) > 3])
-        api_url = f"https://en.wikipedia.org/w/api.php?action=query&list=search&srsearch={urllib.parse.quote(keywords)}&utf8=&format=json"
-        
-        req = urllib.request.Request(api_url, headers={'User-Agent': 'Mozilla/5.0'})
-        resp = json.loads(urllib.request.urlopen(req, timeout=5).read())
-        
+        query_url = f"{api_url}?action=query&list=search&srsearch={urllib.parse.quote(keywords)}&utf8=&format=json"
+
+        resp = pool.run(query_url, lambda u, session: session.get(u, timeout=5).json())
+
         if resp['query']['search']:
             title = resp['query']['search'][0]['title']
-            url = f"https://en.wikipedia.org/wiki/{urllib.parse.quote(title.replace(' ', '_'))}"
+            url = f"{article_url}{urllib.parse.quote(title.replace(' ', '_'))}"
             return url
     except Exception:
         pass
     return None
 
-def main():
+def repair_url(old_url, verifier, wikipedia_api=WIKIPEDIA_API, wikipedia_article=WIKIPEDIA_ARTICLE,
+               search_url=SEARCH_URL):
+    search_term = old_url.split('/')[-1]
+    if not search_term or len(search_term) < 3:
+        search_term = old_url.split('/')[-2]
+
+    search_term = urllib.parse.unquote(search_term).replace('-', ' ').replace('_', ' ')
+
+    url_found = search_wikipedia(search_term + " Pittsburgh", verifier.pool, wikipedia_api, wikipedia_article)
+
+    if not url_found or not verifier.verify(url_found):
+        url_found = fetch_search_results(search_term + " Pittsburgh", verifier.pool, search_url)
+
+    if url_found and verifier.verify(url_found):
+        return search_term, url_found
+    return search_term, None
+
+def main(max_workers=16, host_delay=0.5, cache_path=cache_file, wikipedia_api=WIKIPEDIA_API,
+         wikipedia_article=WIKIPEDIA_ARTICLE, search_url=SEARCH_URL):
     with open(input_file, 'r', encoding='utf-8') as f:
         data = json.load(f)
         
@@ -60,28 +143,27 @@ def main():
     print(f"Starting with {len(working)} working URLs and {len(broken)} broken URLs to fix.")
     
     new_working = set(working)
+    pool = HostPool(host_delay=host_delay)
+    verifier = UrlVerifier(pool, cache_path)
     
-    for i, old_url in enumerate(broken):
-        print(f"[{i+1}/{len(broken)}] Fixing: {old_url}")
-        
-        search_term = old_url.split('/')[-1]
-        if not search_term or len(search_term) < 3:
-            search_term = old_url.split('/')[-2]
-            
-        search_term = urllib.parse.unquote(search_term).replace('-', ' ').replace('_', ' ')
-        print(f"  -> Generated queries: '{search_term}'")
-        
-        url_found = search_wikipedia(search_term + " Pittsburgh")
-        
-        if not url_found or not verify_url(url_found):
-            time.sleep(1)
-            url_found = fetch_search_results(search_term + " Pittsburgh")
-            
-        if url_found and verify_url(url_found):
-            print(f"  -> Found replacement: {url_found}")
-            new_working.add(url_found)
-        else:
-            print("  -> Could not find working alternative.")
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(repair_url, old_url, verifier, wikipedia_api, wikipedia_article, search_url): old_url
+                       for old_url in broken}
+            for i, future in enumerate(as_completed(futures)):
+                old_url = futures[future]
+                search_term, url_found = future.result()
+                print(f"[{i+1}/{len(broken)}] Fixing: {old_url} (query: '{search_term}')")
+                if url_found:
+                    print(f"  -> Found replacement: {url_found}")
+                    new_working.add(url_found)
+                else:
+                    print("  -> Could not find working alternative.")
+    finally:
+        pool.close()
+        verifier.save()
+
+    print(f"\nVerification: {verifier.checks} URLs checked, {verifier.hits} answered from {cache_path}")
             
     final_list = sorted(list(new_working))
     
@@ -0,0 +1,94 @@
+import os
+import json
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from data_pipeline.crawler import HostPool
+from fix_broken_urls import UrlVerifier, repair_url
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers the Wikipedia API, article and DuckDuckGo endpoints locally."""
+    requests_seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="text/html"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        StubHandler.requests_seen.append(("HEAD", self.path))
+        if self.path.startswith("/wiki/Pittsburgh_Zoo"):
+            # Refuses HEAD so the verifier has to fall back to a ranged GET
+            self._send(405)
+        elif self.path.startswith("/found/"):
+            self._send(200)
+        else:
+            self._send(404)
+
+    def do_GET(self):
+        StubHandler.requests_seen.append(("GET", self.path))
+        if self.path.startswith("/w/api.php"):
+            title = "Pittsburgh Zoo" if "Zoos" in self.path else None
+            results = [{"title": title}] if title else []
+            self._send(200, json.dumps({"query": {"search": results}}).encode(), "application/json")
+        elif self.path.startswith("/wiki/Pittsburgh_Zoo"):
+            self._send(206 if self.headers.get("Range") else 200, b"x")
+        elif self.path.startswith("/html/"):
+            target = f"http://127.0.0.1:{self.server.server_port}/found/kennywood"
+            href = "//duckduckgo.com/l/?uddg=" + target.replace(":", "%3A").replace("/", "%2F") + "&rut=0"
+            self._send(200, f'<a class="result__url" href="{href}">result</a>'.encode())
+        else:
+            self._send(404)
+
+class FixBrokenUrlsTest(unittest.TestCase):
+    def setUp(self):
+        StubHandler.requests_seen = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{self.server.server_port}"
+        self.endpoints = (base + "/w/api.php", base + "/wiki/", base + "/html/")
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp.name, "data", "url_verification_cache.json")
+        self.pool = HostPool(host_delay=0)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_wikipedia_hit_verified_with_ranged_get(self):
+        verifier = UrlVerifier(self.pool, self.cache_path)
+        term, url = repair_url("https://example.org/old/Zoos", verifier, *self.endpoints)
+        self.assertEqual(term, "Zoos")
+        self.assertEqual(url, self.endpoints[1] + "Pittsburgh_Zoo")
+        self.assertIn(("GET", "/wiki/Pittsburgh_Zoo"), StubHandler.requests_seen)
+
+    def test_falls_back_to_search_results(self):
+        verifier = UrlVerifier(self.pool, self.cache_path)
+        _, url = repair_url("https://example.org/old/kennywood-park", verifier, *self.endpoints)
+        self.assertTrue(url.endswith("/found/kennywood"))
+
+    def test_cache_written_atomically_and_reused(self):
+        verifier = UrlVerifier(self.pool, self.cache_path)
+        repair_url("https://example.org/old/Zoos", verifier, *self.endpoints)
+        verifier.save()
+        self.assertTrue(os.path.exists(self.cache_path))
+        self.assertFalse(os.path.exists(self.cache_path + ".tmp"))
+
+        reloaded = UrlVerifier(self.pool, self.cache_path)
+        StubHandler.requests_seen = []
+        self.assertTrue(reloaded.verify(self.endpoints[1] + "Pittsburgh_Zoo"))
+        self.assertEqual(reloaded.hits, 1)
+        self.assertEqual(StubHandler.requests_seen, [])
+
+if __name__ == '__main__':
+    unittest.main()